@@ -0,0 +1,66 @@
+"""Накладные расходы планировщика на одну задачу при большой очереди пустых задач.
+
+Каждая задача — тот же граф, что у видео (download и translate параллельно,
+затем mux), но этапы ничего не делают, так что измеряется только диспетчеризация.
+
+    python bench/bench_dispatch.py -n 10000 --playlists 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import Job, StageScheduler
+
+
+def noop(results):
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--jobs", type=int, default=10000)
+    parser.add_argument("--playlists", type=int, default=5)
+    parser.add_argument("--download", type=int, default=3)
+    parser.add_argument("--translate", type=int, default=2)
+    parser.add_argument("--mux", type=int, default=2)
+    args = parser.parse_args()
+
+    scheduler = StageScheduler({"download": args.download, "translate": args.translate, "mux": args.mux})
+    stages = {
+        "download": ("download", (), noop),
+        "translate": ("translate", (), noop),
+        "merge": ("mux", ("download", "translate"), noop),
+    }
+    remaining = [args.jobs]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def finished(job):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+
+    jobs = [Job(f"playlist-{i % args.playlists}", stages, on_done=finished) for i in range(args.jobs)]
+    threads_before = threading.active_count()
+    started = time.perf_counter()
+    for job in jobs:
+        scheduler.submit(job)
+    queued = time.perf_counter() - started
+    done.wait()
+    elapsed = time.perf_counter() - started
+
+    print(f"jobs:               {args.jobs} across {args.playlists} playlists")
+    print(f"submit time:        {queued * 1000:.1f} ms")
+    print(f"total time:         {elapsed * 1000:.1f} ms")
+    print(f"per job overhead:   {elapsed * 1e6 / args.jobs:.1f} us (3 stages each)")
+    print(f"throughput:         {args.jobs / elapsed:.0f} jobs/s")
+    print(f"worker threads:     {threading.active_count() - threads_before}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Накладные расходы на одно видео: нативный конвейер против запуска pwsh translate.ps1.
+
+По умолчанию в PATH подкладываются заглушки из bench/fakes, поэтому сама работа
+утилит почти ничего не стоит и в замере остаётся только обвязка вокруг них.
+Заглушка pwsh из bench/fakes здесь не используется: замер translate.ps1 идёт
+только с настоящим PowerShell.
+
+    python bench/bench_overhead.py -n 20
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+
+def run_child(mode, count, output_dir, pwsh):
+    from pipeline import VideoPipeline
+
+    script_path = os.path.join(ROOT_DIR, "translate.ps1")
+    started = time.perf_counter()
+    for i in range(count):
+        url = f"https://www.youtube.com/watch?v=bench{i:05d}"
+        if mode == "native":
+            VideoPipeline(url, output_dir, True, "best", log=lambda line: None).run()
+        else:
+            subprocess.run([pwsh, "-File", script_path, url, "0.1", "--output-dir", output_dir, "--quality", "best", "--keep-original"],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "mode": mode,
+        "videos": count,
+        "per_video_ms": round(elapsed * 1000 / count, 1),
+        # ru_maxrss в Linux в килобайтах: пиковый RSS самого тяжёлого дочернего процесса
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=20)
+    parser.add_argument("--real-tools", action="store_true", help="не подменять yt-dlp/vot-cli/ffmpeg заглушками")
+    parser.add_argument("--child", choices=("native", "pwsh"), help=argparse.SUPPRESS)
+    parser.add_argument("--pwsh", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with tempfile.TemporaryDirectory() as output_dir:
+            run_child(args.child, args.count, output_dir, args.pwsh)
+        return
+
+    env = dict(os.environ)
+    if not args.real_tools:
+        env["PATH"] = os.path.join(BENCH_DIR, "fakes") + os.pathsep + env.get("PATH", "")
+
+    # Настоящий pwsh ищем в исходном PATH, без bench/fakes: заглушка измеряла бы сама себя
+    fakes_dir = os.path.normcase(os.path.join(BENCH_DIR, "fakes"))
+    real_path = os.pathsep.join(entry for entry in os.environ.get("PATH", "").split(os.pathsep)
+                                if os.path.normcase(os.path.abspath(entry or ".")) != fakes_dir)
+    pwsh = shutil.which("pwsh", path=real_path)
+
+    modes = ["native"]
+    if pwsh:
+        modes.insert(0, "pwsh")
+    else:
+        print("real pwsh not found in PATH, skipping the translate.ps1 measurement", file=sys.stderr)
+
+    for mode in modes:
+        subprocess.run([sys.executable, __file__, "--child", mode, "-n", str(args.count), "--pwsh", pwsh or "pwsh"], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Пропускная способность всего конвейера без сети: плейлисты обрабатываются без окна с заглушками утилит из bench/fakes.
+
+Каждый размер прогоняется в отдельном процессе (чистые синглтоны, честный пиковый
+RSS). Задержки, сбои и размеры файлов заглушек задаются ключами ниже или
+переменными FAKE_* (см. bench/fakes/fakelib.py).
+
+    python bench/bench_suite.py
+    python bench/bench_suite.py --sizes 10,1000 --playlists 4 --latency 0.05 --fail-rate 0.02
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+
+def run_child(args):
+    import pipeline
+    from playlist import PlaylistWorker
+    from scheduler import get_scheduler
+
+    # Повторы в бенчмарке не должны ждать по-настоящему
+    pipeline.RETRY_BACKOFF = pipeline.RATE_LIMIT_BACKOFF = args.retry_backoff
+    scheduler = get_scheduler()
+    scheduler.set_limits({"download": args.download, "translate": args.translate, "mux": args.mux})
+
+    peak_threads = [threading.active_count()]
+    sampling = threading.Event()
+
+    def sample_threads():
+        while not sampling.wait(0.05):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    # Видео поровну по плейлистам; размер плейлиста заглушка yt-dlp берёт из ссылки
+    playlists = min(args.playlists, args.child)
+    sizes = [args.child // playlists + (1 if i < args.child % playlists else 0) for i in range(playlists)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        workers = [PlaylistWorker(f"https://www.youtube.com/playlist?list=BENCH{i:03d}-n{size}", output_dir, 0.1, True, "best", args.powershell,
+                                  log=lambda message: None)
+                   for i, size in enumerate(sizes)]
+        threading.Thread(target=sample_threads, daemon=True).start()
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.wait()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        sampling.set()
+
+        statuses = [worker.status() for worker in workers]
+        videos = sum(status["total"] for status in statuses)
+        failed = sum(len(status["failed"]) for status in statuses)
+        stages = {}
+        for worker in workers:
+            # Замеры плейлиста уже сведены в его отчёт о запуске
+            for name in glob.glob(os.path.join(worker.save_path, "metrics-*.json")):
+                with open(name, encoding="utf-8") as f:
+                    for stage, summary in json.load(f)["stages"].items():
+                        stages.setdefault(stage, []).append(summary["queue_wait_seconds"].get("p50", 0.0))
+        print(json.dumps({
+            "videos": videos,
+            "playlists": playlists,
+            "failed": failed,
+            "seconds": round(elapsed, 2),
+            "jobs_per_second": round(videos / elapsed, 1) if elapsed else 0.0,
+            # Время процессора в самом процессе (без утилит): планировщик, журнал, логи, запуск процессов
+            "overhead_cpu_ms_per_job": round(cpu * 1000 / videos, 2) if videos else 0.0,
+            # Медиана ожидания свободного потока по этапам (худший из плейлистов)
+            "queue_wait_p50_s": {stage: round(max(values), 3) for stage, values in stages.items()},
+            # ru_maxrss в Linux в килобайтах
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "peak_threads": peak_threads[0],
+        }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,1000,10000", help="total videos per run, comma separated")
+    parser.add_argument("--playlists", type=int, default=4)
+    parser.add_argument("--download", type=int, default=8)
+    parser.add_argument("--translate", type=int, default=8)
+    parser.add_argument("--mux", type=int, default=8)
+    parser.add_argument("--powershell", action="store_true", help="process videos through the pwsh stand-in")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds each tool call takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency spread, 0.5 means ±50%%")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of tool calls that fail")
+    parser.add_argument("--fail-kind", default="transient", choices=("transient", "rate_limited", "permanent", "mixed"))
+    parser.add_argument("--video-bytes", type=int, default=1024)
+    parser.add_argument("--audio-bytes", type=int, default=256)
+    parser.add_argument("--retry-backoff", type=float, default=0.1)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            env = dict(os.environ)
+            env.update({
+                "PATH": os.path.join(BENCH_DIR, "fakes") + os.pathsep + env.get("PATH", ""),
+                # Отдельный кэш на каждый прогон: иначе второй прогон возьмёт всё из кэша медиа
+                "YT_TRNSLT_CACHE_DIR": os.path.join(cache_dir, str(size)),
+                "FAKE_UNIQUE_IDS": "1",
+                "FAKE_LATENCY": str(args.latency),
+                "FAKE_JITTER": str(args.jitter),
+                "FAKE_FAIL_RATE": str(args.fail_rate),
+                "FAKE_FAIL_KIND": args.fail_kind,
+                "FAKE_VIDEO_BYTES": str(args.video_bytes),
+                "FAKE_AUDIO_BYTES": str(args.audio_bytes),
+            })
+            child = [sys.executable, __file__, "--child", str(size)] + sys.argv[1:]
+            output = subprocess.run(child, env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+
+    print(f"{'videos':>8} {'failed':>7} {'seconds':>9} {'jobs/s':>8} {'cpu ms/job':>11} {'peak RSS MB':>12} {'threads':>8}")
+    for result in results:
+        print(f"{result['videos']:>8} {result['failed']:>7} {result['seconds']:>9} {result['jobs_per_second']:>8} "
+              f"{result['overhead_cpu_ms_per_job']:>11} {result['peak_rss_mb']:>12} {result['peak_threads']:>8}")
+
+
+if __name__ == "__main__":
+    main()
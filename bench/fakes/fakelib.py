@@ -0,0 +1,44 @@
+# Общее для заглушек утилит: задержка, случайные сбои и размеры файлов из переменных окружения.
+#
+#   FAKE_LATENCY=0.2           задержка каждого вызова, с (FAKE_YTDLP_LATENCY, FAKE_VOTCLI_LATENCY, FAKE_FFMPEG_LATENCY, FAKE_PWSH_LATENCY — для одной утилиты)
+#   FAKE_JITTER=0.5            разброс задержки: ±50%
+#   FAKE_FAIL_RATE=0.05        доля вызовов, завершающихся ошибкой (FAKE_YTDLP_FAIL_RATE и т. д. — для одной утилиты)
+#   FAKE_FAIL_KIND=transient   вид ошибки: transient, rate_limited, permanent или mixed
+#   FAKE_VIDEO_BYTES=1024      размер «скачанного» видео
+#   FAKE_AUDIO_BYTES=256       размер «перевода»
+#   FAKE_PLAYLIST_SIZE=5       видео в плейлисте
+#   FAKE_UNIQUE_IDS=1          ID видео свои у каждого плейлиста (иначе во всех плейлистах одни и те же видео)
+import os
+import random
+import sys
+import time
+
+FAILURES = {
+    "transient": "ERROR: Unable to download webpage: Connection reset by peer",
+    "rate_limited": "ERROR: Unable to download webpage: HTTP Error 429: Too Many Requests",
+    "permanent": "ERROR: [youtube] Video unavailable. This video has been removed by the uploader",
+}
+
+
+def setting(tool, name, default):
+    value = os.environ.get(f"FAKE_{tool.upper().replace('-', '')}_{name}") or os.environ.get(f"FAKE_{name}")
+    return type(default)(value) if value else default
+
+
+def simulate(tool, can_fail=True):
+    """Задержка вызова; при «сбое» печатает ошибку в stderr и завершает процесс с кодом 1."""
+    latency = setting(tool, "LATENCY", 0.0)
+    if latency > 0:
+        jitter = setting(tool, "JITTER", 0.0)
+        time.sleep(max(0.0, latency * random.uniform(1 - jitter, 1 + jitter)))
+    if can_fail and random.random() < setting(tool, "FAIL_RATE", 0.0):
+        kind = setting(tool, "FAIL_KIND", "transient")
+        if kind == "mixed":
+            kind = random.choice(list(FAILURES))
+        print(FAILURES.get(kind, FAILURES["transient"]), file=sys.stderr)
+        sys.exit(1)
+
+
+def write_file(path, size):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
@@ -0,0 +1,132 @@
+"""Консольный режим без окна (и без PyQt6).
+
+    yt-trnslt-d.py run -o /data/videos URL [URL ...]
+    yt-trnslt-d.py run -o /data/videos --watch 1440 URL [URL ...]
+    yt-trnslt-d.py daemon --port 8765
+    yt-trnslt-d.py daemon --socket /run/yt-trnslt-d.sock
+"""
+import argparse
+import signal
+import sys
+
+from media_cache import get_media_cache
+from metrics import get_metrics, serve_metrics
+from pipeline import VARIANTS
+from playlist import PlaylistWatcher, PlaylistWorker
+from scheduler import DEFAULT_LIMITS, STAGES, get_scheduler
+
+
+def console_log(message):
+    # Одна запись на строку: строки из разных потоков не перемешиваются
+    sys.stdout.write(f"{message}\n")
+    sys.stdout.flush()
+
+
+def add_common_options(parser):
+    for stage in STAGES:
+        parser.add_argument(f"--{stage}", type=int, default=DEFAULT_LIMITS[stage], metavar="N",
+                            help=f"concurrent {stage} stages across all playlists (default {DEFAULT_LIMITS[stage]})")
+    parser.add_argument("--media-cache-gb", type=int, default=None, metavar="GB", help="media cache size, 0 disables it")
+    parser.add_argument("--scratch-dir", metavar="DIR",
+                        help="keep per-video temp files here (e.g. tmpfs or a local SSD) instead of the output folder")
+    parser.add_argument("--min-free-gb", type=float, default=None, metavar="GB",
+                        help="disk space to keep free beyond the estimated size of videos in progress (default 1)")
+
+
+def parse_variants(value):
+    variants = tuple(dict.fromkeys(variant.strip() for variant in value.split(",") if variant.strip()))
+    unknown = [variant for variant in variants if variant not in VARIANTS]
+    if not variants or unknown:
+        raise argparse.ArgumentTypeError(f"variants must be some of {', '.join(VARIANTS)}")
+    return variants
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="yt-trnslt-d.py", description="Download YouTube playlists with translated audio. Without arguments opens the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("gui", help="open the window (default)")
+
+    run = commands.add_parser("run", help="process playlists and exit")
+    run.add_argument("playlists", nargs="+", metavar="URL")
+    run.add_argument("-o", "--output", required=True, help="base folder; each playlist gets its own subfolder")
+    run.add_argument("-q", "--quality", default="best", help="video quality, e.g. 1080p or 720p (default best)")
+    run.add_argument("--replace-audio", action="store_true", help="keep only the translated audio track")
+    run.add_argument("--variants", type=parse_variants, metavar="LIST",
+                     help="comma separated outputs from one ffmpeg pass, e.g. dual,replace; the first one gets the plain file name")
+    run.add_argument("--volume", type=int, default=10, help="original track volume in percent (for translate.ps1)")
+    run.add_argument("--powershell", action="store_true", help="process videos through translate.ps1")
+    run.add_argument("--watch", type=float, metavar="MINUTES",
+                     help="keep running and re-check the playlists every MINUTES, queueing only new or changed videos")
+    run.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:PORT/metrics while running")
+    add_common_options(run)
+
+    daemon = commands.add_parser("daemon", help="serve a local JSON API for jobs")
+    daemon.add_argument("--host", default="127.0.0.1")
+    daemon.add_argument("--port", type=int, default=8765)
+    daemon.add_argument("--socket", help="listen on a Unix socket instead of TCP (metrics are at GET /metrics either way)")
+    add_common_options(daemon)
+    return parser
+
+
+def apply_common_options(args):
+    get_scheduler().set_limits({stage: getattr(args, stage) for stage in STAGES})
+    if args.media_cache_gb is not None:
+        get_media_cache().set_max_bytes(args.media_cache_gb * 1024 ** 3)
+    if args.min_free_gb is not None:
+        get_scheduler().set_disk_reserve(args.min_free_gb * 1024 ** 3)
+
+
+def run_playlists(args):
+    """Обрабатываем плейлисты и ждём; код возврата 1, если какие-то видео не удалось обработать.
+
+    Готовые видео без изменений пропускаются по журналу в папке плейлиста,
+    так что повторный запуск только досинхронизирует плейлист. С --watch
+    плейлисты проверяются заново по расписанию до Ctrl+C или SIGTERM.
+    """
+    if args.metrics_port:
+        serve_metrics(lambda: get_metrics().prometheus(get_scheduler()), port=args.metrics_port)
+    options = {"log": console_log, "variants": args.variants, "scratch_dir": args.scratch_dir}
+    playlist_args = (args.output, args.volume / 100.0, not args.replace_audio, args.quality, args.powershell)
+    if args.watch:
+        workers = [PlaylistWatcher(args.watch * 60, url, *playlist_args, **options) for url in args.playlists]
+    else:
+        workers = [PlaylistWorker(url, *playlist_args, **options) for url in args.playlists]
+    for worker in workers:
+        worker.start()
+    try:
+        # Ждём с таймаутом, чтобы Ctrl+C доходил до главного потока
+        while any(worker.is_running() for worker in workers):
+            for worker in workers:
+                worker.wait(0.5)
+    except KeyboardInterrupt:
+        console_log("Stopping...")
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.wait()
+        return 130
+
+    failed = sum(len(worker.status()["failed"]) for worker in workers)
+    total = sum(worker.status()["total"] for worker in workers)
+    console_log(f"Done: {total - failed}/{total} videos processed")
+    # Плейлист, список которого не удалось получить, тоже ошибка
+    return 1 if failed or any(worker.status()["total"] == 0 for worker in workers) else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "gui":
+        from gui import main as gui_main
+        return gui_main()
+
+    # Оркестратор останавливает процесс через SIGTERM — обрабатываем его как Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    get_scheduler().log = console_log
+    apply_common_options(args)
+    if args.command == "run":
+        return run_playlists(args)
+
+    from daemon import JobManager, serve
+    serve(JobManager(log=console_log, scratch_dir=args.scratch_dir), args.host, args.port, args.socket)
+    return 0
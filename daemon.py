@@ -0,0 +1,217 @@
+import itertools
+import json
+import os
+import socketserver
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import PROMETHEUS_CONTENT_TYPE, get_metrics
+from pipeline import VARIANTS
+from playlist import PlaylistWatcher, PlaylistWorker
+from scheduler import get_scheduler
+
+
+class JobManager:
+    """Задания демона: каждое — набор плейлистов с общими настройками, обрабатываемых в общем планировщике."""
+
+    def __init__(self, log=print, scratch_dir=None):
+        self.log = log
+        # Папка для промежуточных файлов по умолчанию; задание может указать свою
+        self.scratch_dir = scratch_dir
+        self.jobs = {}  # id -> задание
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, spec):
+        """Ставим задание из JSON запроса; неверный запрос — ValueError."""
+        playlists = spec.get("playlists")
+        if isinstance(playlists, str):
+            playlists = playlists.split()
+        if not playlists or not all(isinstance(url, str) for url in playlists):
+            raise ValueError("'playlists' must be a non-empty list of playlist URLs")
+        output = spec.get("output")
+        if not isinstance(output, str) or not output:
+            raise ValueError("'output' must be a base folder path")
+        options = {
+            "volume_ratio": float(spec.get("volume", 10)) / 100.0,
+            "keep_original_audio": bool(spec.get("keep_original_audio", True)),
+            "video_quality": str(spec.get("quality", "best")),
+            "use_powershell": bool(spec.get("powershell", False)),
+            "variants": spec.get("variants"),
+            "scratch_dir": spec.get("scratch_dir", self.scratch_dir),
+        }
+        if options["variants"] is not None and (not isinstance(options["variants"], list) or not set(options["variants"]) <= set(VARIANTS)):
+            raise ValueError(f"'variants' must be a list of {', '.join(VARIANTS)}")
+        if options["variants"] is not None:
+            options["variants"] = list(dict.fromkeys(options["variants"]))
+        if options["scratch_dir"] is not None and (not isinstance(options["scratch_dir"], str) or not options["scratch_dir"]):
+            raise ValueError("'scratch_dir' must be a folder path")
+        watch = spec.get("watch_minutes")
+        if watch is not None and (isinstance(watch, bool) or not isinstance(watch, (int, float)) or watch <= 0):
+            raise ValueError("'watch_minutes' must be a positive number")
+        with self.lock:
+            job_id = str(next(self.ids))
+        if watch:
+            # Задание не завершается само: плейлисты проверяются заново, пока его не остановят (DELETE /jobs/<id>)
+            workers = [PlaylistWatcher(watch * 60, url, os.path.abspath(output), log=self.log, **options) for url in playlists]
+        else:
+            workers = [PlaylistWorker(url, os.path.abspath(output), log=self.log, **options) for url in playlists]
+        job = {"id": job_id, "created": time.time(), "output": os.path.abspath(output), "options": options, "watch_minutes": watch, "workers": workers}
+        with self.lock:
+            self.jobs[job_id] = job
+        self.log(f"Job {job_id}: {len(workers)} playlist(s) into {job['output']}")
+        for worker in workers:
+            worker.start()
+        return self.status(job_id)
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        playlists = [worker.status() for worker in job["workers"]]
+        if any(worker.is_running() for worker in job["workers"]):
+            state = "running"
+        elif any(playlist["stopped"] for playlist in playlists):
+            state = "stopped"
+        elif any(playlist["failed"] for playlist in playlists):
+            state = "failed"
+        else:
+            state = "done"
+        return {"id": job["id"], "state": state, "created": job["created"], "output": job["output"], "options": job["options"],
+                "watch_minutes": job["watch_minutes"], "playlists": playlists}
+
+    def list(self):
+        with self.lock:
+            job_ids = list(self.jobs)
+        return [self.status(job_id) for job_id in job_ids]
+
+    def stop(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        for worker in job["workers"]:
+            if worker.is_running():
+                worker.stop()
+        return self.status(job_id)
+
+    def stop_all(self):
+        with self.lock:
+            job_ids = list(self.jobs)
+        for job_id in job_ids:
+            self.stop(job_id)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON API демона.
+
+    GET /status, GET /jobs, POST /jobs, GET /jobs/<id>, DELETE /jobs/<id>;
+    GET /metrics — замеры этапов в формате Prometheus.
+    """
+
+    server_version = "yt-trnslt-d"
+
+    def address_string(self):
+        # У Unix-сокета нет адреса клиента
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        self.server.manager.log(f"API {self.address_string()}: {format % args}")
+
+    def send_json(self, code, payload):
+        self.send_body(code, json.dumps(payload, ensure_ascii=False), "application/json; charset=utf-8")
+
+    def send_body(self, code, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        return parts[0] if parts else "", parts[1] if len(parts) > 1 else None
+
+    def do_GET(self):
+        manager = self.server.manager
+        resource, job_id = self.route()
+        if resource == "status":
+            scheduler = get_scheduler()
+            jobs = manager.list()
+            self.send_json(200, {"limits": scheduler.limits(), "max_limits": scheduler.max_limits(), "queued": scheduler.queued(),
+                                 "jobs": {state: sum(1 for job in jobs if job["state"] == state) for state in ("running", "done", "failed", "stopped")}})
+        elif resource == "metrics":
+            self.send_body(200, get_metrics().prometheus(get_scheduler()), PROMETHEUS_CONTENT_TYPE)
+        elif resource == "jobs" and job_id is None:
+            self.send_json(200, manager.list())
+        elif resource == "jobs":
+            self.send_status(manager.status(job_id), job_id)
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        resource, job_id = self.route()
+        if resource != "jobs" or job_id is not None:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            spec = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(spec, dict):
+                raise ValueError("Request body must be a JSON object")
+            self.send_json(201, self.server.manager.submit(spec))
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+        except OSError as e:
+            # Например, нет прав на папку для сохранения
+            self.send_json(500, {"error": str(e)})
+
+    def do_DELETE(self):
+        resource, job_id = self.route()
+        self.send_status(self.server.manager.stop(job_id) if resource == "jobs" and job_id else None, job_id)
+
+    def send_status(self, status, job_id):
+        if status is None:
+            self.send_json(404, {"error": f"No job {job_id}"})
+        else:
+            self.send_json(200, status)
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    UnixHTTPServer = None
+
+
+def serve(manager, host="127.0.0.1", port=8765, socket_path=None):
+    """Обслуживаем API до Ctrl+C; по умолчанию слушаем только localhost."""
+    if socket_path:
+        if UnixHTTPServer is None:
+            raise OSError("Unix sockets are not supported on this platform, use --port")
+        if os.path.lexists(socket_path):
+            # Удаляем только сокет от прошлого запуска: файл, оказавшийся по этому пути по ошибке, не трогаем
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise OSError(f"{socket_path} exists and is not a socket")
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, ApiHandler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), ApiHandler)
+        server.daemon_threads = True
+        address = f"http://{host}:{server.server_address[1]}"
+    server.manager = manager
+    manager.log(f"Listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        manager.log("Stopping all jobs...")
+        manager.stop_all()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,356 @@
+import sys
+
+from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit, QPlainTextEdit, QFileDialog, QLabel, QHBoxLayout, QSpinBox, QCheckBox, QProgressBar, QComboBox
+from PyQt6.QtCore import QThread, QTimer, pyqtSignal, QMutex, QMutexLocker
+
+from logs import LOG_FLUSH_MS, LOG_VIEW_LINES, LogBuffer
+from media_cache import get_media_cache
+from playlist import PlaylistWorker
+from qualities import ProbeCancelled, QualityProbe, get_quality_cache
+from scheduler import get_scheduler
+
+QUALITY_DEBOUNCE_MS = 500  # пауза после последнего изменения ссылки перед проверкой качеств
+
+
+class QualityWorker(QThread):
+    quality_signal = pyqtSignal(list)
+    finished_signal = pyqtSignal()
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, playlist_url):
+        super().__init__()
+        self.playlist_url = playlist_url
+        self.probe = QualityProbe(log=self.log_signal.emit)
+
+    def get_available_qualities(self, playlist_url):
+        try:
+            return self.probe.get_available_qualities(playlist_url)
+        except ProbeCancelled:
+            return None
+        except Exception as e:
+            self.log_signal.emit(f"Error in get_available_qualities: {str(e)}")
+            return ["best"]
+
+    def cancel(self):
+        """Не блокирует вызывающий поток: запущенный yt-dlp убивается, результат не отправляется."""
+        self.probe.cancel()
+
+    def run(self):
+        qualities = self.get_available_qualities(self.playlist_url)
+        if qualities is not None and not self.probe.cancelled.is_set():
+            self.quality_signal.emit(qualities)
+        self.finished_signal.emit()
+
+
+class DownloadWorker(QThread):
+    """PlaylistWorker в потоке Qt: о ходе работы сообщает сигналами окну."""
+
+    progress_signal = pyqtSignal(str, int, int, bool)  # (playlist_url, processed, total, listing_done)
+    finished_signal = pyqtSignal(str)
+
+    def __init__(self, playlist_url, save_path, volume_ratio, keep_original_audio, video_quality, use_powershell=False, scheduler=None, media_cache=None,
+                 log=print, variants=None, scratch_dir=None):
+        super().__init__()
+        self.playlist_url = playlist_url
+        self.playlist = PlaylistWorker(playlist_url, save_path, volume_ratio, keep_original_audio, video_quality, use_powershell, scheduler, media_cache,
+                                       log=log, on_progress=self.progress_signal.emit, on_finished=self.finished_signal.emit, variants=variants,
+                                       scratch_dir=scratch_dir)
+
+    def run(self):
+        self.playlist.run()
+
+    def stop(self):
+        self.playlist.stop()
+
+
+class YouTubeDownloader(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.workers = {}
+        self.available_qualities = ["best"]
+        self.mutex = QMutex()
+        self.quality_cache = get_quality_cache()
+        self.current_quality_worker = None
+        self.quality_workers = set()  # в том числе отменённые, пока их поток не завершился
+        # Строки лога из всех потоков копятся в буфере и попадают в окно одним блоком по таймеру
+        self.log = LogBuffer()
+        self.progress_widgets = {}  # playlist_url -> (label, progress bar)
+        self.pending_progress = {}  # playlist_url -> (processed, total, listing_done), ещё не показанные
+        self.initUI()
+        get_scheduler().log = self.log
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(LOG_FLUSH_MS)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start()
+
+    def initUI(self):
+        self.setWindowTitle("YouTube Video Processor")
+        self.setGeometry(100, 100, 600, 500)
+
+        layout = QVBoxLayout()
+
+        self.link_input = QLineEdit(self)
+        self.link_input.setPlaceholderText("Введите ссылки на YouTube плейлисты через пробел")
+        # Проверяем качества не на каждое нажатие, а после паузы в наборе
+        self.quality_timer = QTimer(self)
+        self.quality_timer.setSingleShot(True)
+        self.quality_timer.setInterval(QUALITY_DEBOUNCE_MS)
+        self.quality_timer.timeout.connect(self.schedule_quality_update)
+        self.link_input.textChanged.connect(self.quality_timer.start)
+        layout.addWidget(self.link_input)
+
+        self.loading_progress = QProgressBar(self)
+        self.loading_progress.setRange(0, 0)
+        self.loading_progress.setVisible(False)
+        layout.addWidget(self.loading_progress)
+
+        path_layout = QHBoxLayout()
+        self.path_label = QLabel("Базовая папка для сохранения: Не выбрано", self)
+        self.select_button = QPushButton("Выбрать папку", self)
+        self.select_button.clicked.connect(self.select_folder)
+        path_layout.addWidget(self.path_label)
+        path_layout.addWidget(self.select_button)
+        layout.addLayout(path_layout)
+
+        # Промежуточные файлы видео можно держать на другом диске (tmpfs, быстрый SSD), а не рядом с результатами
+        scratch_layout = QHBoxLayout()
+        self.scratch_path = None
+        self.scratch_label = QLabel("Папка для временных файлов: в папке плейлиста", self)
+        self.scratch_button = QPushButton("Выбрать папку", self)
+        self.scratch_button.clicked.connect(self.select_scratch_folder)
+        scratch_layout.addWidget(self.scratch_label)
+        scratch_layout.addWidget(self.scratch_button)
+        layout.addLayout(scratch_layout)
+
+        self.volume_input = QSpinBox(self)
+        self.volume_input.setRange(0, 100)
+        self.volume_input.setValue(10)
+        self.volume_input.setSuffix("%")
+        layout.addWidget(QLabel("Громкость оригинальной дорожки (для метаданных):"))
+        layout.addWidget(self.volume_input)
+        
+        self.keep_original_audio = QCheckBox("Сохранить обе аудиодорожки", self)
+        self.keep_original_audio.setChecked(True)
+        layout.addWidget(self.keep_original_audio)
+
+        # Второй файл из того же прохода ffmpeg почти ничего не стоит: дорожки копируются без перекодирования
+        self.both_variants = QCheckBox("Дополнительно сохранить второй вариант (.dual.mp4 или .replace.mp4)", self)
+        self.both_variants.setChecked(False)
+        layout.addWidget(self.both_variants)
+
+        self.use_powershell = QCheckBox("Обрабатывать через translate.ps1 (PowerShell)", self)
+        self.use_powershell.setChecked(False)
+        layout.addWidget(self.use_powershell)
+
+        self.quality_label = QLabel("Качество видео:", self)
+        layout.addWidget(self.quality_label)
+        self.quality_combo = QComboBox(self)
+        self.quality_combo.addItems(self.available_qualities)
+        self.quality_combo.setCurrentText("best")
+        layout.addWidget(self.quality_combo)
+
+        # Общие для всех плейлистов лимиты по этапам: сеть, переводчик и ffmpeg
+        limits = get_scheduler().max_limits()
+        stage_layout = QHBoxLayout()
+        self.stage_inputs = {}
+        for stage, title in (("download", "Скачиваний:"), ("translate", "Переводов:"), ("mux", "Склеек ffmpeg:")):
+            spin = QSpinBox(self)
+            spin.setRange(1, 16)
+            spin.setValue(limits[stage])
+            spin.valueChanged.connect(self.update_stage_limits)
+            stage_layout.addWidget(QLabel(title))
+            stage_layout.addWidget(spin)
+            self.stage_inputs[stage] = spin
+        layout.addWidget(QLabel("Одновременно выполняемых этапов (на все плейлисты):"))
+        layout.addLayout(stage_layout)
+
+        # Кэш скачанных видео, переводов и готовых файлов, общий для плейлистов и запусков
+        self.media_cache_input = QSpinBox(self)
+        self.media_cache_input.setRange(0, 2000)
+        self.media_cache_input.setValue(get_media_cache().max_bytes // 1024 ** 3)
+        self.media_cache_input.setSuffix(" ГБ")
+        self.media_cache_input.valueChanged.connect(self.update_media_cache_size)
+        layout.addWidget(QLabel("Размер кэша медиа (0 — не использовать):"))
+        layout.addWidget(self.media_cache_input)
+        
+        self.playlist_progress_layout = QVBoxLayout()
+        layout.addLayout(self.playlist_progress_layout)
+
+        self.log_output = QPlainTextEdit(self)
+        self.log_output.setReadOnly(True)
+        self.log_output.setMaximumBlockCount(LOG_VIEW_LINES)
+        layout.addWidget(self.log_output)
+
+        button_layout = QHBoxLayout()
+        self.start_button = QPushButton("Запустить", self)
+        self.start_button.clicked.connect(self.start_process)
+        button_layout.addWidget(self.start_button)
+
+        self.stop_button = QPushButton("Остановить", self)
+        self.stop_button.clicked.connect(self.stop_process)
+        self.stop_button.setEnabled(False)
+        button_layout.addWidget(self.stop_button)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def schedule_quality_update(self):
+        playlist_urls = self.link_input.text().strip().split()
+        first_url = playlist_urls[0] if playlist_urls else None
+        current = self.current_quality_worker
+        if current and current.playlist_url == first_url and current.isRunning():
+            # Этот адрес уже проверяется — второй раз не запускаем
+            return
+        if current:
+            # Отмена не ждёт поток: yt-dlp убивается, а поток сам завершится
+            current.cancel()
+            self.current_quality_worker = None
+            self.loading_progress.setVisible(False)
+
+        if first_url:
+            # Уже проверенный плейлист берём из кэша на диске сразу, без фонового yt-dlp
+            cached = self.quality_cache.playlist_qualities(first_url)
+            if cached is not None:
+                self.update_quality_combo(cached)
+            else:
+                self.loading_progress.setVisible(True)
+                worker = QualityWorker(first_url)
+                self.current_quality_worker = worker
+                self.quality_workers.add(worker)
+                worker.quality_signal.connect(self.on_qualities_ready)
+                worker.finished_signal.connect(self.hide_loading_progress)
+                worker.log_signal.connect(self.log)
+                worker.finished.connect(lambda worker=worker: self.quality_workers.discard(worker))
+                worker.start()
+
+    def on_qualities_ready(self, qualities):
+        # Результат устаревшей (отменённой) проверки игнорируем
+        if self.sender() is self.current_quality_worker:
+            self.update_quality_combo(qualities)
+
+    def update_quality_combo(self, qualities):
+        if qualities != self.available_qualities:
+            self.available_qualities = qualities
+            self.quality_combo.clear()
+            self.quality_combo.addItems(self.available_qualities)
+            self.quality_combo.setCurrentText(self.available_qualities[0])
+            self.log(f"Updated quality options to: {self.available_qualities}")
+
+    def update_stage_limits(self):
+        get_scheduler().set_limits({stage: spin.value() for stage, spin in self.stage_inputs.items()})
+
+    def update_media_cache_size(self):
+        get_media_cache().set_max_bytes(self.media_cache_input.value() * 1024 ** 3)
+
+    def hide_loading_progress(self):
+        if self.sender() is self.current_quality_worker:
+            self.loading_progress.setVisible(False)
+
+    def select_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Выберите базовую папку для сохранения")
+        if folder:
+            self.save_path = folder
+            self.path_label.setText(f"Базовая папка для сохранения: {folder}")
+
+    def select_scratch_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Выберите папку для временных файлов")
+        # Отмена выбора возвращает временные файлы в папку плейлиста
+        self.scratch_path = folder or None
+        self.scratch_label.setText(f"Папка для временных файлов: {folder or 'в папке плейлиста'}")
+
+    def update_progress(self, playlist_url, processed, total, listing_done=True):
+        # Только запоминаем: виджеты обновляются в flush, сколько бы сигналов ни пришло между сбросами
+        self.pending_progress[playlist_url] = (processed, total, listing_done)
+
+    def flush(self):
+        lines = self.log.drain()
+        if lines:
+            self.log_output.appendPlainText("\n".join(lines))
+        pending, self.pending_progress = self.pending_progress, {}
+        for playlist_url, (processed, total, listing_done) in pending.items():
+            self.show_progress(playlist_url, processed, total, listing_done)
+
+    def show_progress(self, playlist_url, processed, total, listing_done):
+        # Пока список видео ещё получается, итог растёт — помечаем его «+»
+        total_text = f"{total}" if listing_done else f"{total}+"
+        text = f"{playlist_url[:20]}... ({processed}/{total_text})"
+        widgets = self.progress_widgets.get(playlist_url)
+        if widgets is None:
+            progress_widget = QWidget()
+            progress_layout = QHBoxLayout()
+            label = QLabel(text)
+            progress_bar = QProgressBar()
+            progress_layout.addWidget(label)
+            progress_layout.addWidget(progress_bar)
+            progress_widget.setLayout(progress_layout)
+            self.playlist_progress_layout.addWidget(progress_widget)
+            widgets = self.progress_widgets[playlist_url] = (label, progress_bar)
+        label, progress_bar = widgets
+        label.setText(text)
+        progress_bar.setMaximum(total)
+        progress_bar.setValue(processed)
+
+    def clear_progress(self):
+        self.progress_widgets = {}
+        self.pending_progress = {}
+        for i in reversed(range(self.playlist_progress_layout.count())):
+            self.playlist_progress_layout.itemAt(i).widget().setParent(None)
+
+    def start_process(self):
+        playlist_urls = self.link_input.text().strip().split()
+        if not playlist_urls:
+            self.log("Ошибка: Введите ссылки на плейлисты!")
+            return
+        
+        if not hasattr(self, 'save_path'):
+            self.log("Ошибка: Выберите базовую папку для сохранения!")
+            return
+        
+        volume_ratio = self.volume_input.value() / 100.0
+        keep_original_audio = self.keep_original_audio.isChecked()
+        variants = None
+        if self.both_variants.isChecked():
+            variants = ("dual", "replace") if keep_original_audio else ("replace", "dual")
+        self.update_stage_limits()
+        video_quality = self.quality_combo.currentText()
+        use_powershell = self.use_powershell.isChecked()
+        
+        self.workers = {}
+        self.clear_progress()
+
+        for playlist_url in playlist_urls:
+            worker = DownloadWorker(playlist_url, self.save_path, volume_ratio, keep_original_audio, video_quality, use_powershell, log=self.log, variants=variants,
+                                    scratch_dir=self.scratch_path)
+            self.workers[playlist_url] = worker
+            worker.progress_signal.connect(self.update_progress)
+            worker.finished_signal.connect(self.check_completion)
+            # finished_signal приходит, пока поток ещё жив; итоговую проверку делаем по завершению самого потока
+            worker.finished.connect(lambda url=playlist_url: self.check_completion(url))
+            worker.start()
+
+        self.log("Запуск параллельной обработки...")
+        self.start_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+
+    def stop_process(self):
+        for worker in self.workers.values():
+            if worker:
+                worker.stop()
+        self.start_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.clear_progress()
+
+    def check_completion(self, playlist_url):
+        with QMutexLocker(self.mutex):
+            all_completed = all(not worker.isRunning() for worker in self.workers.values() if worker is not None)
+            if all_completed:
+                self.log("Все задачи завершены!")
+                self.start_button.setEnabled(True)
+                self.stop_button.setEnabled(False)
+
+
+def main():
+    app = QApplication(sys.argv)
+    window = YouTubeDownloader()
+    window.show()
+    return app.exec()
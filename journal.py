@@ -0,0 +1,170 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+JOURNAL_NAME = ".yt-trnslt-d.sqlite3"
+CHECKSUM_CHUNK = 1024 ** 2
+
+
+def checksum(path):
+    """SHA-256 файла, читаем кусками: готовые видео бывают по несколько гигабайт."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Journal:
+    """Журнал обработки в папке плейлиста (SQLite): состояние каждого этапа каждого видео и пути к результатам.
+
+    После остановки или сбоя повторный запуск продолжает видео с первого
+    незавершённого этапа, а уже готовые видео пропускает. Он же — индекс
+    готовых файлов по ID видео: размер, время изменения и SHA-256 каждого
+    варианта и настройки, с которыми он получен. Видео, файл которого пропал,
+    изменился или был сделан с другими настройками, обрабатывается заново.
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, JOURNAL_NAME)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY, url TEXT, state TEXT, temp_dir TEXT, output TEXT, updated REAL)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS stages (
+            video_id TEXT, stage TEXT, state TEXT, artifact TEXT, attempts INTEGER DEFAULT 0, error TEXT, updated REAL,
+            PRIMARY KEY (video_id, stage))""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS outputs (
+            video_id TEXT, variant TEXT, path TEXT, size INTEGER, mtime REAL, sha256 TEXT, settings TEXT,
+            PRIMARY KEY (video_id, variant))""")
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def video(self, video_id):
+        """Запись о видео: {"state", "temp_dir", "output"} или None."""
+        rows = self.execute("SELECT state, temp_dir, output FROM videos WHERE video_id = ?", (video_id,))
+        if not rows:
+            return None
+        state, temp_dir, output = rows[0]
+        return {"state": state, "temp_dir": temp_dir, "output": output}
+
+    def finished_output(self, video_id):
+        """Путь к готовому файлу, если видео уже обработано и файл на месте."""
+        video = self.video(video_id)
+        if video and video["state"] == "done" and video["output"] and os.path.exists(video["output"]):
+            return video["output"]
+        return None
+
+    def record_outputs(self, video_id, settings, files):
+        """Запоминаем готовые файлы видео {вариант: путь} с их контрольными суммами."""
+        rows = []
+        for variant, path in files.items():
+            stat = os.stat(path)
+            rows.append((video_id, variant, path, stat.st_size, stat.st_mtime, checksum(path), settings))
+        with self.lock:
+            with self.db:
+                self.db.execute("BEGIN")
+                self.db.execute("DELETE FROM outputs WHERE video_id = ?", (video_id,))
+                self.db.executemany("INSERT INTO outputs (video_id, variant, path, size, mtime, sha256, settings) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def unchanged_output(self, video_id, settings):
+        """Путь к готовому файлу, если видео обработано с теми же настройками и его файлы не изменились.
+
+        Размер и время изменения сверяются всегда; контрольная сумма
+        пересчитывается, только если время изменения другое (например, файл
+        скопировали обратно из резервной копии).
+        """
+        video = self.video(video_id)
+        if not video or video["state"] != "done" or not video["output"]:
+            return None
+        rows = self.execute("SELECT variant, path, size, mtime, sha256, settings FROM outputs WHERE video_id = ?", (video_id,))
+        if not rows:
+            # Видео обработано до появления индекса — достаточно, что файл на месте
+            return self.finished_output(video_id)
+        for variant, path, size, mtime, sha256, recorded_settings in rows:
+            if recorded_settings != settings:
+                return None
+            try:
+                stat = os.stat(path)
+                if stat.st_size != size or (stat.st_mtime != mtime and checksum(path) != sha256):
+                    return None
+            except OSError:
+                return None
+            if stat.st_mtime != mtime:
+                self.execute("UPDATE outputs SET mtime = ? WHERE video_id = ? AND variant = ?", (stat.st_mtime, video_id, variant))
+        return video["output"]
+
+    def forget_finished(self, video_id):
+        """Готовое видео обрабатывается заново: его этапы прошлого раза не должны пропускаться.
+
+        Возвращает True, если видео было готово (его файл пропал, изменился
+        или нужен с другими настройками).
+        """
+        video = self.video(video_id)
+        if not video or video["state"] != "done":
+            return False
+        self.execute("DELETE FROM stages WHERE video_id = ?", (video_id,))
+        return True
+
+    def start_video(self, video_id, url):
+        self.execute("""INSERT INTO videos (video_id, url, state, updated) VALUES (?, ?, 'running', ?)
+            ON CONFLICT(video_id) DO UPDATE SET url = excluded.url, state = 'running', updated = excluded.updated""",
+                     (video_id, url, time.time()))
+
+    def set_temp_dir(self, video_id, temp_dir):
+        # Вставка, если записи о видео ещё нет: иначе папка не попадёт в журнал и не будет продолжена
+        self.execute("""INSERT INTO videos (video_id, state, temp_dir, updated) VALUES (?, 'running', ?, ?)
+            ON CONFLICT(video_id) DO UPDATE SET temp_dir = excluded.temp_dir, updated = excluded.updated""",
+                     (video_id, temp_dir, time.time()))
+
+    def finish_video(self, video_id, state, output=None):
+        self.execute("UPDATE videos SET state = ?, output = ?, updated = ? WHERE video_id = ?", (state, output, time.time(), video_id))
+        if state == "done":
+            # Готовому видео промежуточные результаты больше не нужны
+            self.execute("UPDATE videos SET temp_dir = NULL WHERE video_id = ?", (video_id,))
+
+    def temp_dirs(self):
+        """Временные папки, которые ещё понадобятся: в них продолжат работу незавершённые видео.
+
+        Кроме записанных у видео учитываются и папки с готовыми результатами
+        этапов — даже если сама папка в запись о видео почему-то не попала.
+        """
+        paths = {row[0] for row in self.execute("SELECT temp_dir FROM videos WHERE temp_dir IS NOT NULL")}
+        for (artifact,) in self.execute("SELECT artifact FROM stages WHERE state = 'done' AND artifact IS NOT NULL"):
+            folder = os.path.dirname(os.path.abspath(artifact))
+            while os.path.dirname(folder) != folder:
+                if os.path.basename(folder).startswith("temp_"):
+                    paths.add(folder)
+                    break
+                folder = os.path.dirname(folder)
+        return {os.path.normcase(os.path.abspath(path)) for path in paths}
+
+    def completed_artifact(self, video_id, stage):
+        """Результат этапа из прошлого запуска, если этап завершён и файл ещё существует."""
+        rows = self.execute("SELECT artifact FROM stages WHERE video_id = ? AND stage = ? AND state = 'done'", (video_id, stage))
+        if rows and rows[0][0] and os.path.exists(rows[0][0]):
+            return rows[0][0]
+        return None
+
+    def stage_started(self, video_id, stage):
+        self.execute("""INSERT INTO stages (video_id, stage, state, attempts, updated) VALUES (?, ?, 'running', 1, ?)
+            ON CONFLICT(video_id, stage) DO UPDATE SET state = 'running', attempts = attempts + 1, error = NULL, updated = excluded.updated""",
+                     (video_id, stage, time.time()))
+
+    def stage_done(self, video_id, stage, artifact):
+        self.execute("UPDATE stages SET state = 'done', artifact = ?, updated = ? WHERE video_id = ? AND stage = ?",
+                     (artifact, time.time(), video_id, stage))
+
+    def stage_failed(self, video_id, stage, error):
+        self.execute("UPDATE stages SET state = 'failed', error = ?, updated = ? WHERE video_id = ? AND stage = ?",
+                     (error, time.time(), video_id, stage))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
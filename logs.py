@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+
+LOG_FLUSH_MS = 100  # окно получает накопившиеся строки одним блоком не чаще, чем раз в столько мс
+LOG_BUFFER_LINES = 5000  # строк между двумя сбросами; при переполнении старые выбрасываются
+LOG_VIEW_LINES = 20000  # строк, которые хранит окно лога
+LOG_DIR = "logs"  # папка логов видео внутри папки плейлиста
+VIDEO_LOG_BYTES = 1024 ** 2
+VIDEO_LOG_BACKUPS = 2
+
+
+class LogBuffer:
+    """Кольцевой буфер общего лога: потоки пишут в него без сигналов Qt, окно забирает строки пачкой (drain).
+
+    Строки ниже level отбрасываются сразу. Если между двумя сбросами строк
+    больше, чем помещается в буфер, теряются самые старые, а drain сообщает,
+    сколько их было.
+    """
+
+    def __init__(self, maxlen=LOG_BUFFER_LINES, level=INFO):
+        self.lines = deque(maxlen=maxlen)
+        self.level = level
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, message, level=INFO):
+        if level < self.level:
+            return
+        with self.lock:
+            if len(self.lines) == self.lines.maxlen:
+                self.dropped += 1
+            self.lines.append(message)
+
+    def drain(self):
+        """Все накопившиеся строки; буфер очищается."""
+        with self.lock:
+            lines = list(self.lines)
+            self.lines.clear()
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.insert(0, f"... пропущено строк лога: {dropped} ...")
+        return lines
+
+
+class VideoLog:
+    """Лог одного видео: всё, включая построчный вывод утилит, пишется в ротируемый файл, а сообщения уровня INFO — ещё и в общий лог.
+
+    Файл открывается при первой записи, поэтому видео, ожидающие в очереди,
+    не держат открытых файлов.
+    """
+
+    def __init__(self, folder, name, log=print):
+        self.path = os.path.join(folder, LOG_DIR, f"{name}.log")
+        self.log = log
+        self.handler = None
+        self.lock = threading.Lock()
+
+    def __call__(self, message, level=INFO):
+        self.write(message, level)
+        if level >= INFO:
+            self.log(message)
+
+    def debug(self, message):
+        """Подробности (вывод yt-dlp, vot-cli, ffmpeg, pwsh) — только в файл видео."""
+        self.write(message, DEBUG)
+
+    def write(self, message, level):
+        with self.lock:
+            if self.handler is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.handler = RotatingFileHandler(self.path, maxBytes=VIDEO_LOG_BYTES, backupCount=VIDEO_LOG_BACKUPS, encoding="utf-8")
+                self.handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            self.handler.handle(logging.makeLogRecord({"msg": message, "levelno": level, "levelname": logging.getLevelName(level)}))
+
+    def close(self):
+        with self.lock:
+            if self.handler is not None:
+                self.handler.close()
+                self.handler = None
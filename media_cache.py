@@ -0,0 +1,198 @@
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+INDEX_SAVE_DELAY = 5  # изменения индекса копятся столько секунд и пишутся на диск одним разом
+
+
+def default_cache_dir():
+    """Папка кэша приложения: YT_TRNSLT_CACHE_DIR, %LOCALAPPDATA% на Windows или ~/.cache."""
+    if os.environ.get("YT_TRNSLT_CACHE_DIR"):
+        return os.environ["YT_TRNSLT_CACHE_DIR"]
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "yt-trnslt-d")
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "yt-trnslt-d")
+
+
+class MediaCache:
+    """Общий для всех плейлистов и запусков кэш скачанных видео и переводов.
+
+    Ключ — ID видео, вид данных и вариант (качество). Размер
+    ограничен max_bytes, лишнее выселяется по давности использования (LRU).
+    Файлы, которые сейчас читает конвейер, закреплены и не выселяются. Если
+    один и тот же файл одновременно нужен нескольким конвейерам, готовит его
+    один, а остальные ждут (get_or_claim).
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or os.path.join(default_cache_dir(), "media")
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.root, "index.json")
+        self.lock = threading.Condition()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.save_timer = None
+        self.pins = {}
+        self.producing = set()
+        self.entries = self.load()
+        # Отложенные изменения индекса не должны потеряться при обычном завершении процесса
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            if self.enabled:
+                self.evict()
+
+    def load(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        for key, entry in list(entries.items()):
+            if key.startswith("output/"):
+                # Готовые файлы прежние версии тоже кэшировали; теперь дубликат склеивается из видео и перевода
+                shutil.rmtree(os.path.dirname(entry["path"]), ignore_errors=True)
+                del entries[key]
+        # Записи, файлы которых удалили вручную, забываем
+        return {key: entry for key, entry in entries.items() if os.path.exists(entry["path"])}
+
+    def changed(self):
+        # Вызывается под self.lock: индекс пишется целиком, поэтому не на каждое изменение, а раз в INDEX_SAVE_DELAY
+        self.dirty = True
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(INDEX_SAVE_DELAY, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        """Пишем индекс на диск, если он менялся; сама запись идёт без блокировки кэша."""
+        with self.save_lock:
+            with self.lock:
+                if self.save_timer is not None:
+                    self.save_timer.cancel()
+                    self.save_timer = None
+                if not self.dirty:
+                    return
+                self.dirty = False
+                data = json.dumps(self.entries)
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+
+    def key(self, kind, video_id, variant="default"):
+        return f"{kind}/{video_id}/{variant}"
+
+    def get(self, key):
+        """Путь к файлу из кэша (закреплённому до release) или None."""
+        with self.lock:
+            return self.lookup(key)
+
+    def get_or_claim(self, key, cancelled=None):
+        """(путь из кэша или None, claimed): при claimed файл готовит вызывающий и потом вызывает put или abandon.
+
+        Отменённое ожидание возвращает (None, False): ключ по-прежнему
+        принадлежит тому, кто его готовит, и отпускать его нельзя.
+        """
+        with self.lock:
+            while True:
+                path = self.lookup(key)
+                if path is not None:
+                    return path, False
+                if key not in self.producing:
+                    self.producing.add(key)
+                    return None, True
+                # Этот же файл сейчас скачивает/переводит другой плейлист — ждём его
+                self.lock.wait_for(lambda: key not in self.producing or (cancelled is not None and cancelled.is_set()))
+                if cancelled is not None and cancelled.is_set():
+                    return None, False
+
+    def abandon(self, key):
+        with self.lock:
+            self.producing.discard(key)
+            self.lock.notify_all()
+
+    def interrupt(self):
+        with self.lock:
+            self.lock.notify_all()
+
+    def lookup(self, key):
+        # Вызывается под self.lock
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if not os.path.exists(entry["path"]):
+            del self.entries[key]
+            self.changed()
+            return None
+        # Время использования нужно только для порядка выселения: на диск оно попадёт со следующим изменением индекса
+        entry["last_used"] = time.time()
+        self.pins[key] = self.pins.get(key, 0) + 1
+        return entry["path"]
+
+    def put(self, key, src):
+        """Переносим файл в кэш и возвращаем закреплённый путь в кэше."""
+        directory = os.path.join(self.root, key)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, os.path.basename(src))
+        shutil.move(src, path)
+        with self.lock:
+            old = self.entries.get(key)
+            if old and old["path"] != path and os.path.exists(old["path"]):
+                os.remove(old["path"])
+            self.entries[key] = {"path": path, "size": os.path.getsize(path), "last_used": time.time()}
+            self.pins[key] = self.pins.get(key, 0) + 1
+            self.producing.discard(key)
+            self.evict()
+            self.changed()
+            self.lock.notify_all()
+        return path
+
+    def release(self, key):
+        with self.lock:
+            count = self.pins.get(key, 0) - 1
+            if count > 0:
+                self.pins[key] = count
+            else:
+                self.pins.pop(key, None)
+
+    def size(self):
+        with self.lock:
+            return sum(entry["size"] for entry in self.entries.values())
+
+    def evict(self):
+        # Вызывается под self.lock
+        total = sum(entry["size"] for entry in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key in self.pins:
+                continue
+            shutil.rmtree(os.path.dirname(entry["path"]), ignore_errors=True)
+            del self.entries[key]
+            total -= entry["size"]
+            self.changed()
+
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache():
+    """Общий на процесс кэш медиа."""
+    global _media_cache
+    with _media_cache_lock:
+        if _media_cache is None:
+            _media_cache = MediaCache()
+        return _media_cache
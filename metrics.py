@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Этапы в порядке отчёта: список плейлиста, проверка качеств, этапы видео и уборка временной папки
+STAGE_ORDER = ("listing", "probe", "download", "translate", "merge", "powershell", "cleanup")
+SECONDS_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+PERCENTILES = (50, 90, 95, 99)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def result_bytes(value):
+    """Результат этапа видео — путь к файлу; его размер и есть объём, произведённый этапом."""
+    if isinstance(value, str) and os.path.isfile(value):
+        return os.path.getsize(value)
+    return 0
+
+
+def percentiles(values):
+    """Перцентили по ближайшему рангу, среднее и максимум."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{p}": round(ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))], 3) for p in PERCENTILES}
+    result["mean"] = round(sum(ordered) / len(ordered), 3)
+    result["max"] = round(ordered[-1], 3)
+    return result
+
+
+class Histogram:
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """Замеры этапов: время работы, ожидание в очереди, байты, итог и повторы.
+
+    Общие счётчики и гистограммы отдаются в формате Prometheus (prometheus),
+    а отдельные замеры копятся по владельцу (плейлисту) до summary, который
+    сводит их в перцентили для отчёта о запуске.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outcomes = defaultdict(int)  # (stage, status) -> count
+        self.wall = defaultdict(Histogram)  # stage -> Histogram
+        self.wait = defaultdict(Histogram)
+        self.bytes = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.samples = defaultdict(list)  # owner -> [(stage, wall, wait, size, status, retry)]
+
+    def record(self, stage, owner=None, wall=0.0, wait=0.0, size=0, status="ok", retry=False):
+        with self.lock:
+            self.outcomes[(stage, status)] += 1
+            self.wall[stage].observe(wall)
+            self.wait[stage].observe(wait)
+            self.bytes[stage] += size
+            if retry:
+                self.retries[stage] += 1
+            if owner is not None:
+                self.samples[owner].append((stage, wall, wait, size, status, retry))
+
+    def summary(self, owner):
+        """Сводка по этапам владельца; его замеры после этого забываются."""
+        with self.lock:
+            samples = self.samples.pop(owner, [])
+        stages = {}
+        for stage, wall, wait, size, status, retry in samples:
+            entry = stages.setdefault(stage, {"count": 0, "status": defaultdict(int), "retries": 0, "bytes": 0, "wall": [], "wait": []})
+            entry["count"] += 1
+            entry["status"][status] += 1
+            entry["retries"] += int(retry)
+            entry["bytes"] += size
+            entry["wall"].append(wall)
+            entry["wait"].append(wait)
+        order = {stage: i for i, stage in enumerate(STAGE_ORDER)}
+        result = {}
+        for stage in sorted(stages, key=lambda stage: order.get(stage, len(order))):
+            entry = stages[stage]
+            result[stage] = {
+                "count": entry["count"],
+                "status": dict(entry["status"]),
+                "retries": entry["retries"],
+                "bytes": entry["bytes"],
+                "wall_seconds": dict(percentiles(entry["wall"]), total=round(sum(entry["wall"]), 3)),
+                "queue_wait_seconds": percentiles(entry["wait"]),
+            }
+        return result
+
+    def write_summary(self, owner, folder, extra=None):
+        """Отчёт о запуске в JSON рядом с результатами: metrics-ГГГГММДД-ЧЧММСС-мс.json в папке плейлиста."""
+        report = dict(extra or {})
+        report["stages"] = self.summary(owner)
+        now = time.time()
+        name = f"metrics-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now % 1 * 1000):03d}"
+        suffix = 1
+        while True:
+            path = os.path.join(folder, f"{name}.json" if suffix == 1 else f"{name}-{suffix}.json")
+            try:
+                # Режим "x": отчёт другого запуска с тем же временем не затирается
+                f = open(path, "x", encoding="utf-8")
+            except FileExistsError:
+                suffix += 1
+                continue
+            with f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            return path
+
+    def prometheus(self, scheduler=None):
+        """Текстовый формат Prometheus; с планировщиком — ещё и текущие лимиты и очередь."""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, histograms, help_text):
+            family(name, "histogram", help_text)
+            for stage, hist in sorted(histograms.items()):
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {hist.count}')
+
+        with self.lock:
+            family("yt_trnslt_stage_runs_total", "counter", "Finished stage runs by result.")
+            for (stage, status), count in sorted(self.outcomes.items()):
+                lines.append(f'yt_trnslt_stage_runs_total{{stage="{stage}",status="{status}"}} {count}')
+            histogram("yt_trnslt_stage_seconds", self.wall, "Stage wall time.")
+            histogram("yt_trnslt_stage_queue_wait_seconds", self.wait, "Time a stage waited for a free worker.")
+            family("yt_trnslt_stage_bytes_total", "counter", "Bytes produced or transferred by a stage.")
+            for stage, size in sorted(self.bytes.items()):
+                lines.append(f'yt_trnslt_stage_bytes_total{{stage="{stage}"}} {size}')
+            family("yt_trnslt_stage_retries_total", "counter", "Stage runs that were retries of a failed attempt.")
+            for stage, count in sorted(self.retries.items()):
+                lines.append(f'yt_trnslt_stage_retries_total{{stage="{stage}"}} {count}')
+
+        if scheduler is not None:
+            family("yt_trnslt_stage_limit", "gauge", "Current (adaptive) concurrency limit of a scheduler stage.")
+            for stage, limit in scheduler.limits().items():
+                lines.append(f'yt_trnslt_stage_limit{{stage="{stage}"}} {limit}')
+            family("yt_trnslt_stage_max_limit", "gauge", "Configured concurrency ceiling of a scheduler stage.")
+            for stage, limit in scheduler.max_limits().items():
+                lines.append(f'yt_trnslt_stage_max_limit{{stage="{stage}"}} {limit}')
+            family("yt_trnslt_videos_queued", "gauge", "Videos waiting for admission.")
+            lines.append(f"yt_trnslt_videos_queued {scheduler.queued()}")
+            family("yt_trnslt_disk_reserved_bytes", "gauge", "Estimated disk space held by admitted videos.")
+            lines.append(f"yt_trnslt_disk_reserved_bytes {scheduler.reserved_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Общие на процесс замеры."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(render, host="127.0.0.1", port=9464):
+    """GET /metrics в фоновом потоке (для консольного режима); возвращает сервер."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.render = render
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
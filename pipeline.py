@@ -0,0 +1,473 @@
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+
+from scheduler import Job, StageCancelled, get_scheduler
+
+# Внешние утилиты, которые нативный конвейер вызывает напрямую (без PowerShell)
+TOOLS = ("yt-dlp", "vot-cli", "ffmpeg")
+# Сколько последних строк вывода утилиты хранится для сообщения об ошибке и её классификации
+TOOL_OUTPUT_TAIL = 200
+PROBE_TIMEOUT = 30
+# Варианты готового файла: обе дорожки (оригинал и перевод) или только перевод
+VARIANTS = ("dual", "replace")
+# Аудиокодеки, которые mp4 принимает как есть: такие дорожки копируются без перекодирования
+MP4_AUDIO_CODECS = {"aac", "mp3", "ac3", "eac3", "alac"}
+
+
+# Повторы упавшего этапа: число попыток и базовая задержка (удваивается с каждой попыткой)
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 5
+# При ограничении частоты запросов ждём дольше и пробуем больше раз
+RATE_LIMIT_ATTEMPTS = 6
+RATE_LIMIT_BACKOFF = 30
+
+# Классы ошибок утилит по их выводу: ограничение частоты, временная сетевая, постоянная
+RATE_LIMIT_PATTERNS = re.compile(r"HTTP Error 429|Too Many Requests|rate.?limit|throttl|confirm you.re not a bot", re.IGNORECASE)
+TRANSIENT_PATTERNS = re.compile(r"timed? ?out|Connection (reset|refused|aborted)|Temporary failure in name resolution|Network is unreachable|"
+                                r"HTTP Error 5\d\d|IncompleteRead|ECONNRESET|ETIMEDOUT|EAI_AGAIN|Unable to download", re.IGNORECASE)
+PERMANENT_PATTERNS = re.compile(r"Video unavailable|Private video|has been removed|not available in your country|members.only|Unsupported URL|"
+                                r"is not a valid URL|HTTP Error 404|Invalid data found|No such file or directory", re.IGNORECASE)
+
+
+class PipelineError(Exception):
+    def __init__(self, message, kind="transient"):
+        super().__init__(message)
+        self.kind = kind  # "rate_limited", "transient" или "permanent"
+
+    @property
+    def retryable(self):
+        return self.kind != "permanent"
+
+
+def classify_failure(returncode, lines):
+    """Класс ошибки утилиты по коду возврата и выводу; неизвестные ошибки считаем временными."""
+    if returncode is not None and returncode < 0:
+        # Процесс убит сигналом (например, OOM killer): вывод обрывается на полуслове, сама операция могла бы пройти
+        return "transient"
+    text = "\n".join(lines)
+    if RATE_LIMIT_PATTERNS.search(text):
+        return "rate_limited"
+    if TRANSIENT_PATTERNS.search(text):
+        return "transient"
+    if PERMANENT_PATTERNS.search(text):
+        return "permanent"
+    if returncode in (126, 127):
+        # Оболочка не смогла запустить утилиту (нет прав или файла) — повтор не поможет
+        return "permanent"
+    # Остальные коды ошибок повторяем как временные
+    return "transient"
+
+
+def resolve_tool(name):
+    """Полный путь к утилите (на Windows находит .exe/.cmd через PATHEXT)."""
+    return shutil.which(name) or name
+
+
+def tools_available():
+    """Проверяем, что все утилиты для нативного конвейера есть в PATH."""
+    return all(shutil.which(tool) for tool in TOOLS)
+
+
+def format_selector(quality):
+    """Строка -f для yt-dlp по выбранному качеству (как в translate.ps1)."""
+    if quality == "best":
+        return "bestvideo+bestaudio/best"
+    # Берём высоту до "p": для "1080p60" это 1080, а не 108060
+    match = re.match(r'(\d+)', quality)
+    if not match:
+        return "bestvideo+bestaudio/best"
+    height = int(match.group(1))
+    return f"bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]/best[height<={height}]/best"
+
+
+def audio_codecs(path):
+    """Кодеки аудиодорожек файла по ffprobe; None, если ffprobe нет или он не справился."""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    try:
+        result = subprocess.run([ffprobe, "-v", "error", "-select_streams", "a", "-show_entries", "stream=codec_name", "-of", "json", path],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, text=True, timeout=PROBE_TIMEOUT)
+        if result.returncode != 0:
+            return None
+        return [stream.get("codec_name") for stream in json.loads(result.stdout).get("streams", [])]
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+def output_variants(keep_original_audio, variants=None):
+    """Варианты готового файла без повторов; без явного списка — один, по флажку «сохранить обе дорожки»."""
+    # Повтор дал бы два выхода ffmpeg в один и тот же .part
+    return tuple(dict.fromkeys(variants)) if variants else ("dual" if keep_original_audio else "replace",)
+
+
+def output_settings(video_quality, variants):
+    """Настройки, от которых зависит готовый файл; с другими настройками видео обрабатывается заново."""
+    return f"{video_quality}/{'+'.join(variants)}"
+
+
+def video_id(url):
+    """ID видео YouTube из ссылки; для прочих ссылок — короткий хэш самой ссылки."""
+    match = re.search(r'(?:[?&]v=|youtu\.be/|/shorts/|/live/)([A-Za-z0-9_-]{6,})', url)
+    if match:
+        return match.group(1)
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+
+class VideoPipeline:
+    """Обработка одного видео: скачивание, перевод, склейка ffmpeg и очистка."""
+
+    def __init__(self, video_url, output_dir, keep_original_audio=True, video_quality="best", log=print, scheduler=None, owner=None, on_start=None,
+                 media_cache=None, journal=None, tool_log=None, variants=None, scratch_dir=None, size_estimate=None):
+        self.video_url = video_url
+        self.output_dir = output_dir
+        # Временные файлы можно держать на другом диске (tmpfs, быстрый SSD), готовые файлы всё равно пишутся в output_dir
+        self.scratch_dir = scratch_dir or output_dir
+        # Функция без аргументов -> ожидаемый размер скачанного видео в байтах или None;
+        # вызывается при допуске видео, и по ней планировщик учитывает свободное место
+        self.size_estimate = size_estimate
+        self.keep_original_audio = keep_original_audio
+        # Варианты готового файла из одного прохода ffmpeg; первый — основной, остальные получают суффикс .<вариант>
+        self.variants = output_variants(keep_original_audio, variants)
+        self.video_quality = video_quality
+        self.log = log
+        # Построчный вывод утилит; по умолчанию идёт в тот же лог
+        self.tool_log = tool_log or log
+        self.scheduler = scheduler or get_scheduler()
+        self.owner = owner or video_url
+        self.on_start = on_start
+        self.video_id = video_id(video_url)
+        self.media_cache = media_cache if media_cache is not None and media_cache.enabled else None
+        self.pinned = []
+        self.journal = journal
+        self.started = False
+        self.job = None
+        self.temp_dir = None
+        self.procs = set()
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.stopped = False  # остановлено пользователем, а не из-за ошибки этапа
+
+    def run_tool(self, args):
+        """Запускаем утилиту, построчно пишем её вывод в tool_log, возвращаем (код, строки)."""
+        with self.lock:
+            if self.cancelled.is_set():
+                raise StageCancelled()
+            proc = subprocess.Popen([resolve_tool(args[0])] + list(args[1:]), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    stdin=subprocess.DEVNULL, text=True, encoding="utf-8", errors="replace")
+            self.procs.add(proc)
+        try:
+            lines = deque(maxlen=TOOL_OUTPUT_TAIL)
+            for line in proc.stdout:
+                line = line.rstrip()
+                if line:
+                    lines.append(line)
+                    self.tool_log(line)
+            proc.wait()
+            if self.cancelled.is_set():
+                # Процесс убит остановкой, его код возврата ничего не говорит об ошибке
+                raise StageCancelled()
+            return proc.returncode, list(lines)
+        finally:
+            with self.lock:
+                self.procs.discard(proc)
+
+    def begin(self):
+        # Вызывается в начале каждого этапа; срабатывает один раз, когда видео реально пошло в работу
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            previous = self.journal.video(self.video_id) if self.journal is not None else None
+            if previous and previous["temp_dir"] and os.path.isdir(previous["temp_dir"]):
+                # Папка прошлого незавершённого запуска: в ней уже могут лежать готовые результаты этапов
+                self.temp_dir = previous["temp_dir"]
+            # Запоминаем под блокировкой: параллельный этап может создать новую папку раньше, чем мы дойдём до лога
+            resumed = self.temp_dir
+            if self.journal is not None:
+                # Запись о видео появляется до того, как параллельный этап сможет записать в неё временную папку
+                self.journal.start_video(self.video_id, self.video_url)
+        if self.on_start:
+            self.on_start()
+        if resumed:
+            self.log(f"Resuming in temp directory: {resumed}")
+
+    def create_temp_dirs(self):
+        # Временная папка создаётся первым этапом, которому она нужна
+        with self.lock:
+            if not self.temp_dir:
+                os.makedirs(self.scratch_dir, exist_ok=True)
+                self.temp_dir = tempfile.mkdtemp(prefix="temp_", dir=self.scratch_dir)
+                self.log(f"Creating temp directories: {self.temp_dir}")
+                if self.journal is not None:
+                    self.journal.set_temp_dir(self.video_id, self.temp_dir)
+            for sub in ("video", "audio"):
+                os.makedirs(os.path.join(self.temp_dir, sub), exist_ok=True)
+
+    def checkpoint(self, stage, func):
+        """Этап с записью в журнал: этап, завершённый в прошлом запуске, не повторяется."""
+        if self.journal is None:
+            return func()
+        artifact = self.journal.completed_artifact(self.video_id, stage)
+        if artifact:
+            self.log(f"Resuming {self.video_id}: {stage} already done ({artifact})")
+            return artifact
+        self.journal.stage_started(self.video_id, stage)
+        try:
+            artifact = func()
+        except Exception as e:
+            self.journal.stage_failed(self.video_id, stage, str(e))
+            raise
+        self.journal.stage_done(self.video_id, stage, artifact)
+        return artifact
+
+    def retry_delay(self, stage, error, attempt):
+        """Задержка перед повтором упавшего этапа или None, если повторять не нужно."""
+        kind = getattr(error, "kind", "transient")
+        attempts, backoff = (RATE_LIMIT_ATTEMPTS, RATE_LIMIT_BACKOFF) if kind == "rate_limited" else (RETRY_ATTEMPTS, RETRY_BACKOFF)
+        if self.cancelled.is_set() or kind == "permanent" or attempt >= attempts:
+            return None
+        # Случайный разброс, чтобы видео, упёршиеся в лимит одновременно, не вернулись тоже одновременно
+        delay = round(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5), 1)
+        self.log(f"Retrying {stage} for {self.video_id} in {delay}s (attempt {attempt + 1}/{attempts}, {kind}): {str(error)}")
+        return delay
+
+    def media_key(self, kind):
+        variants = {
+            "video": self.video_quality,
+            "audio": "default",
+        }
+        return self.media_cache.key(kind, self.video_id, variants[kind])
+
+    def cached(self, kind, produce):
+        """Результат этапа из кэша медиа; при промахе производим его и кладём в кэш."""
+        if self.media_cache is None:
+            return produce()
+        key = self.media_key(kind)
+        path, claimed = self.media_cache.get_or_claim(key, self.cancelled)
+        if self.cancelled.is_set():
+            if claimed:
+                self.media_cache.abandon(key)
+            elif path is not None:
+                self.media_cache.release(key)
+            raise StageCancelled()
+        if path is not None:
+            self.pinned.append(key)
+            self.log(f"Using cached {kind} for {self.video_id}: {path}")
+            return path
+        try:
+            produced = produce()
+            # put тоже может упасть (нет места, нет прав) — ключ нельзя оставлять занятым, иначе повтор будет ждать сам себя
+            path = self.media_cache.put(key, produced)
+        except BaseException:
+            self.media_cache.abandon(key)
+            raise
+        self.pinned.append(key)
+        return path
+
+    def download(self):
+        return self.cached("video", lambda: self.checkpoint("download", self.download_to_temp))
+
+    def translate(self):
+        return self.cached("audio", lambda: self.checkpoint("translate", self.translate_to_temp))
+
+    def download_to_temp(self):
+        self.create_temp_dirs()
+        video_dir = os.path.join(self.temp_dir, "video")
+        self.log(f"Downloading video: {self.video_url} to {video_dir} with quality: {self.video_quality}")
+        code, output = self.run_tool(["yt-dlp", "-o", os.path.join(video_dir, "%(title)s.mp4"), "-f", format_selector(self.video_quality),
+                                      self.video_url, "--merge-output-format", "mp4", "--no-progress"])
+        if code != 0:
+            raise PipelineError(f"Error downloading video: {' '.join(output[-5:])}", classify_failure(code, output))
+
+        # Недокачанные куски (.part) от прошлых попыток yt-dlp докачивает сам, но результатом они не являются
+        files = sorted(name for name in os.listdir(video_dir) if not name.endswith((".part", ".ytdl")))
+        if not files:
+            raise PipelineError(f"Error: Video file not found in {video_dir}")
+        video_file = os.path.join(video_dir, files[0])
+        size = os.path.getsize(video_file)
+        self.log(f"Downloaded file size: {size} bytes")
+        if size == 0:
+            raise PipelineError("Error: Downloaded file is empty!")
+        return video_file
+
+    def translate_to_temp(self):
+        self.create_temp_dirs()
+        audio_dir = os.path.join(self.temp_dir, "audio")
+        for name in os.listdir(audio_dir):
+            # Остатки неудачной попытки
+            os.remove(os.path.join(audio_dir, name))
+        self.log(f"Translating audio for: {self.video_url} to {audio_dir}")
+        code, output = self.run_tool(["vot-cli", self.video_url, "--output", audio_dir])
+        if code != 0:
+            raise PipelineError(f"Error translating audio: {' '.join(output[-5:])}", classify_failure(code, output))
+
+        files = sorted(os.listdir(audio_dir))
+        if not files:
+            raise PipelineError(f"Error: Translated audio not found in {audio_dir}")
+        return os.path.join(audio_dir, files[0])
+
+    def output_path(self, video_file, variant):
+        name = os.path.splitext(os.path.basename(video_file))[0]
+        if variant != self.variants[0]:
+            name += f".{variant}"
+        return os.path.join(self.output_dir, name + ".mp4")
+
+    def variant_args(self, variant, original_codecs, translated_codecs):
+        """Ключи ffmpeg для одного выходного файла: видео копируется, аудио — если mp4 примет его как есть."""
+        args = ["-map", "0:v"]
+        if variant == "dual":
+            args += ["-map", "0:a"]
+        args += ["-map", "1:a:0", "-c:v", "copy", "-c:a", "aac", "-b:a", "128k"]
+        # Номера дорожек в выходном файле известны, только если известен состав оригинала
+        originals = original_codecs if variant == "dual" else []
+        if originals is not None:
+            for index, codec in enumerate(originals + (translated_codecs or [None])[:1]):
+                if codec in MP4_AUDIO_CODECS:
+                    # Ключ с номером дорожки перекрывает общий -c:a
+                    args += [f"-c:a:{index}", "copy"]
+        if variant == "dual":
+            translated = len(originals) if originals else 1
+            args += ["-metadata:s:a:0", "language=orig", "-metadata:s:a:0", "title=Original Audio",
+                     f"-metadata:s:a:{translated}", "language=tran", f"-metadata:s:a:{translated}", "title=Translated Audio"]
+        return args + ["-f", "mp4"]
+
+    def merge(self, video_file, audio_file):
+        """Все варианты за один проход ffmpeg; каждый пишется во временный .part и переименовывается целиком."""
+        outputs = {variant: self.output_path(video_file, variant) for variant in self.variants}
+        original_codecs = audio_codecs(video_file) if "dual" in self.variants else []
+        translated_codecs = audio_codecs(audio_file)
+        self.log(f"Audio codecs: original {original_codecs}, translated {translated_codecs}")
+        args = ["ffmpeg", "-i", video_file, "-i", audio_file]
+        for variant, output_file in outputs.items():
+            self.log(f"Merging video and audio into: {output_file}")
+            args += self.variant_args(variant, original_codecs, translated_codecs) + ["-y", output_file + ".part"]
+        try:
+            code, output = self.run_tool(args)
+            if code != 0:
+                raise PipelineError(f"Error merging with ffmpeg: {' '.join(output[-5:])}", classify_failure(code, output))
+        except BaseException:
+            for output_file in outputs.values():
+                if os.path.exists(output_file + ".part"):
+                    os.remove(output_file + ".part")
+            raise
+        for variant, output_file in outputs.items():
+            # Переименование в той же папке атомарно: недописанный файл под готовым именем не появится
+            os.replace(output_file + ".part", output_file)
+            self.log(f"Successfully saved: {output_file}")
+            self.log(f"Final file size: {os.path.getsize(output_file)} bytes")
+        self.record_outputs(outputs)
+        return outputs[self.variants[0]]
+
+    def record_outputs(self, outputs):
+        # Индекс готовых файлов в журнале: по нему следующий запуск пропустит видео без изменений
+        if self.journal is not None:
+            self.journal.record_outputs(self.video_id, output_settings(self.video_quality, self.variants), outputs)
+
+    def cleanup(self, keep_temp=False):
+        if self.media_cache is not None:
+            for key in self.pinned:
+                self.media_cache.release(key)
+            self.pinned = []
+        if keep_temp and self.temp_dir:
+            self.log(f"Keeping {self.temp_dir} to resume {self.video_id} on the next run")
+            self.temp_dir = None
+        if self.temp_dir:
+            self.log(f"Cleaning up: {self.temp_dir}")
+            started = time.monotonic()
+            size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(self.temp_dir) for name in names)
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            if self.scheduler.metrics is not None:
+                self.scheduler.metrics.record("cleanup", self.owner, wall=time.monotonic() - started, size=size)
+            self.temp_dir = None
+
+    def stages(self):
+        """Граф этапов: перевод нужен только по ссылке, поэтому идёт параллельно со скачиванием.
+
+        Для видео, уже обработанного в другом плейлисте, скачивание и перевод
+        берутся из кэша медиа, и остаётся только склейка копированием потоков.
+        """
+        return {
+            "download": ("download", (), lambda results: self.run_stage(self.download)),
+            "translate": ("translate", (), lambda results: self.run_stage(self.translate)),
+            "merge": ("mux", ("download", "translate"),
+                      lambda results: self.run_stage(lambda: self.checkpoint("merge", lambda: self.merge(results["download"], results["translate"])))),
+        }
+
+    def run_stage(self, func):
+        self.begin()
+        return func()
+
+    def submit(self, on_done=None):
+        """Ставим видео в общий планировщик; on_done(путь к файлу или None) вызывается по завершении."""
+        def finished(job):
+            output = None
+            if job.error is None:
+                output = job.results["merge"]
+            elif isinstance(job.error, StageCancelled):
+                # Снятые с очереди до начала работы видео не засоряют лог
+                if self.started:
+                    self.log(str(job.error))
+            elif isinstance(job.error, PipelineError):
+                self.log(str(job.error))
+            else:
+                self.log(f"Unexpected error in VideoPipeline: {str(job.error)}")
+            if self.journal is not None and self.started:
+                self.journal.finish_video(self.video_id, "done" if output else "stopped" if isinstance(job.error, StageCancelled) else "failed", output)
+            # С журналом промежуточные результаты неудачного видео оставляем — следующий запуск их подхватит
+            self.cleanup(keep_temp=output is None and self.journal is not None)
+            if on_done:
+                on_done(output)
+
+        stages = self.stages()
+        self.job = Job(self.owner, stages, on_done=finished, on_failure=self.abort, retry=self.retry_delay)
+        if self.size_estimate is not None:
+            self.job.disk = self.disk_estimate
+        self.scheduler.submit(self.job)
+        return self.job
+
+    def disk_estimate(self):
+        size = self.size_estimate()
+        if not size:
+            return []
+        # Пока видео в работе, оно занимает место под скачанное и перевод, а при склейке — ещё и под каждый вариант
+        return [(self.scratch_dir, size), (self.output_dir, size * len(self.variants))]
+
+    def run(self):
+        """Полный цикл обработки с ожиданием; возвращает путь к готовому файлу или None."""
+        done = threading.Event()
+        outputs = []
+        self.submit(lambda output: (outputs.append(output), done.set()))
+        done.wait()
+        return outputs[0]
+
+    def stop(self):
+        self.stopped = True
+        self.abort()
+
+    def abort(self):
+        """Прерываем все этапы видео: по остановке или когда один из этапов упал окончательно."""
+        with self.lock:
+            self.cancelled.set()
+            procs = list(self.procs)
+        if self.media_cache is not None:
+            self.media_cache.interrupt()
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        # Снимаем с очередей этапы, которые ещё не начались
+        if self.job is not None:
+            self.scheduler.cancel(self.job)
@@ -0,0 +1,491 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from journal import Journal
+from logs import VideoLog
+from media_cache import get_media_cache
+from metrics import result_bytes
+from pipeline import VideoPipeline, output_settings, output_variants, tools_available, video_id
+from qualities import QualityProbe, get_quality_cache
+from scheduler import Job, StageCancelled, get_scheduler
+
+
+class VideoProcessor:
+    """Одно видео плейлиста: ставит задачу в общий планировщик и сообщает о её завершении."""
+
+    def __init__(self, video_url, index, total, save_path, volume_ratio, keep_original_audio, video_quality, use_powershell=False, scheduler=None, owner=None,
+                 log=print, on_finished=None, media_cache=None, journal=None, variants=None, scratch_dir=None, size_estimate=None):
+        self.video_url = video_url
+        self.index = index
+        self.total = total
+        self.save_path = save_path
+        self.volume_ratio = volume_ratio
+        self.keep_original_audio = keep_original_audio
+        self.variants = variants
+        self.video_quality = video_quality
+        self.use_powershell = use_powershell
+        self.scheduler = scheduler or get_scheduler()
+        self.owner = owner or video_url
+        # Сообщения о видео идут и в общий лог, и в его собственный файл; вывод утилит — только в файл
+        self.log = VideoLog(save_path, video_id(video_url), log)
+        self.on_finished = on_finished
+        self.media_cache = media_cache
+        self.journal = journal
+        self.scratch_dir = scratch_dir
+        self.size_estimate = size_estimate
+        self.script_path = os.path.join(os.path.dirname(__file__), "translate.ps1")
+        self.proc = None
+        self.pipeline = None
+        self.job = None
+        # start и stop не пересекаются: остановка между регистрацией видео и его запуском не должна потеряться
+        self.lock = threading.Lock()
+        self.stopped = False
+
+    def position(self):
+        # Пока плейлист ещё перечисляется, общее число видео неизвестно
+        return f"{self.index} of {self.total}" if self.total else str(self.index)
+
+    def start(self):
+        with self.lock:
+            if self.stopped:
+                # Плейлист остановили раньше, чем видео успело попасть в планировщик
+                self.finish()
+                return
+            self.submit()
+
+    def submit(self):
+        if self.use_powershell or not tools_available():
+            # translate.ps1 делает всё одним процессом, поэтому учитываем его по самому узкому месту — сети
+            self.job = Job(self.owner, {"powershell": ("download", (), lambda results: self.run_powershell())}, on_done=self.powershell_finished)
+            self.scheduler.submit(self.job)
+            return
+
+        # Нативный конвейер: yt-dlp, vot-cli и ffmpeg вызываются напрямую, без запуска pwsh на каждое видео
+        self.pipeline = VideoPipeline(self.video_url, self.save_path, self.keep_original_audio, self.video_quality,
+                                      log=self.log, tool_log=self.log.debug, scheduler=self.scheduler, owner=self.owner,
+                                      on_start=lambda: self.log(f"Processing video {self.position()}: {self.video_url}"),
+                                      media_cache=self.media_cache, journal=self.journal, variants=self.variants,
+                                      scratch_dir=self.scratch_dir, size_estimate=self.size_estimate)
+        self.pipeline.submit(on_done=self.pipeline_finished)
+
+    def pipeline_finished(self, output_file):
+        if output_file:
+            self.log(f"Successfully processed video {self.position()}: {self.video_url}")
+            results = self.pipeline.job.results
+            if "download" in results:
+                # Фактический размер уточняет оценку для следующих видео того же качества
+                get_quality_cache().note_size(self.video_quality, result_bytes(results["download"]) + result_bytes(results["translate"]))
+        elif self.pipeline.started and not self.pipeline.stopped:
+            self.log(f"Error processing video {self.index} ({self.video_url})")
+        self.finish(failed=not output_file and not self.pipeline.stopped)
+
+    def powershell_finished(self, job):
+        if isinstance(job.error, StageCancelled):
+            if self.proc:
+                self.log(f"Processing stopped for video {self.index} ({self.video_url})")
+        elif job.error is not None:
+            self.log(f"Critical error processing video {self.index} ({self.video_url}): {str(job.error)}")
+        failed = not isinstance(job.error, StageCancelled) and (job.error is not None or self.proc is None or self.proc.returncode != 0)
+        self.finish(failed=failed)
+
+    def finish(self, failed=False):
+        self.log.close()
+        if self.on_finished:
+            self.on_finished(self.video_url, self.index, failed)
+
+    def run_powershell(self):
+        """Запасной вариант: обработка через translate.ps1."""
+        self.log(f"Processing video {self.position()}: {self.video_url}")
+        process = ["pwsh", "-File", self.script_path, self.video_url, str(self.volume_ratio), "--output-dir", self.save_path, "--quality", self.video_quality]
+        if self.keep_original_audio:
+            process.append("--keep-original")
+        else:
+            process.append("--replace-audio")
+
+        self.proc = subprocess.Popen(process, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, universal_newlines=True)
+        for line in self.proc.stdout:
+            self.log.debug(line.strip())
+
+        stderr_output = self.proc.stderr.read()
+        if stderr_output:
+            self.log.debug("PowerShell stderr:")
+            self.log.debug(stderr_output)
+
+        self.proc.wait()
+        if self.proc.returncode != 0:
+            self.log(f"Error processing video {self.index} ({self.video_url}): PowerShell exited with code {self.proc.returncode}")
+        else:
+            self.log(f"Successfully processed video {self.position()}: {self.video_url}")
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+        if self.pipeline:
+            if self.pipeline.started:
+                self.log(f"Processing stopped for video {self.index} ({self.video_url})")
+            self.pipeline.stop()
+            return
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        if self.job:
+            self.scheduler.cancel(self.job)
+
+
+class PlaylistWorker:
+    """Один плейлист: получает список видео, ставит их в общий планировщик и ждёт завершения.
+
+    Не зависит от Qt: окно оборачивает его в QThread, а консольный режим и
+    демон запускают в обычном потоке (start). О ходе работы сообщает через
+    on_progress(playlist_url, обработано, всего, список получен полностью) и
+    on_finished(playlist_url).
+    """
+
+    def __init__(self, playlist_url, save_path, volume_ratio, keep_original_audio, video_quality, use_powershell=False, scheduler=None, media_cache=None,
+                 log=print, on_progress=None, on_finished=None, variants=None, scratch_dir=None):
+        self.playlist_url = playlist_url
+        # Пишется из потоков планировщика, поэтому должен быть потокобезопасным (print, LogBuffer)
+        self.log = log
+        self.on_progress = on_progress or (lambda playlist_url, processed, total, listing_done: None)
+        self.on_finished = on_finished or (lambda playlist_url: None)
+        # Извлекаем уникальную часть ссылки (например, list=PL0YH8fFyfiJLnIqljE44IyEXMfFBgHcOw)
+        folder_name = self.extract_folder_name(playlist_url)
+        self.save_path = os.path.join(save_path, folder_name)  # Путь с учётом имени папки
+        os.makedirs(self.save_path, exist_ok=True)  # Создаём папку, если её нет
+        # Временные папки видео: в отдельной папке для промежуточных файлов (своя подпапка на плейлист) или рядом с результатами
+        self.scratch_path = os.path.join(scratch_dir, folder_name) if scratch_dir else self.save_path
+        self.volume_ratio = volume_ratio
+        self.keep_original_audio = keep_original_audio
+        # Варианты готового файла (pipeline.VARIANTS), например обе дорожки и только перевод за один проход ffmpeg
+        self.variants = variants
+        self.video_quality = video_quality
+        self.use_powershell = use_powershell
+        # С этими настройками сверяется индекс готовых файлов в журнале
+        self.output_settings = output_settings(video_quality, output_variants(keep_original_audio, variants))
+        # Лимиты и очередь видео — в общем для всех плейлистов планировщике этапов
+        self.scheduler = scheduler or get_scheduler()
+        # Общий кэш медиа: дубликаты из разных плейлистов и прошлых запусков не скачиваются заново
+        self.media_cache = media_cache or get_media_cache()
+        # Журнал этапов в папке плейлиста: после перезапуска готовые видео пропускаются, начатые продолжаются
+        self.journal = Journal(self.save_path)
+        self.processed_videos = set()
+        self.total_videos = 0
+        self.workers = {}  # index -> VideoProcessor, только незавершённые
+        self.lock = threading.Lock()
+        self.completed_count = 0
+        self.unchanged_count = 0  # видео, готовые файлы которых не изменились с прошлого запуска
+        self.failed_videos = {}  # index -> url: видео, которые не удалось обработать даже после повторов
+        self.stop_requested = False
+        self.all_done = threading.Event()
+        self.listing_proc = None
+        self.listing_done = False
+        self.listing_error = ""
+        self.size_probed = False
+        self.thread = None
+        self.started_at = time.time()
+
+    def start(self):
+        """Запуск в отдельном потоке (без Qt)."""
+        self.thread = threading.Thread(target=self.run, name=f"playlist-{self.extract_folder_name(self.playlist_url)}", daemon=True)
+        self.thread.start()
+
+    def wait(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def status(self):
+        """Снимок состояния для консоли и API демона."""
+        with self.lock:
+            return {
+                "playlist_url": self.playlist_url,
+                "output_dir": self.save_path,
+                "total": self.total_videos,
+                "listing_done": self.listing_done,
+                "completed": self.completed_count,
+                "unchanged": self.unchanged_count,
+                "in_progress": len(self.workers),
+                "failed": [self.failed_videos[index] for index in sorted(self.failed_videos)],
+                "stopped": self.stop_requested,
+            }
+
+    def extract_folder_name(self, url):
+        """Извлекаем уникальную часть ссылки для имени папки."""
+        match = re.search(r'list=([^&]+)', url)
+        if match:
+            return match.group(1)
+        # Если не удалось извлечь list, используем последние 10 символов ссылки
+        return url.replace(':', '_').replace('/', '_').replace('?', '_').replace('&', '_')[-10:]
+
+    def iter_video_urls(self):
+        """Построчно читаем вывод yt-dlp --flat-playlist: ссылки отдаются по мере получения, а не после всего списка."""
+        with tempfile.TemporaryFile(mode="w+", encoding="utf-8", errors="replace") as stderr:
+            with self.lock:
+                if self.stop_requested:
+                    return
+                started = time.monotonic()
+                size = 0
+                self.listing_proc = subprocess.Popen(["yt-dlp", "--flat-playlist", "--get-url", self.playlist_url], stdout=subprocess.PIPE, stderr=stderr,
+                                                     stdin=subprocess.DEVNULL, text=True, encoding="utf-8", errors="replace")
+            for line in self.listing_proc.stdout:
+                size += len(line)
+                line = line.strip()
+                if line:
+                    yield line
+            self.listing_proc.wait()
+            stderr.seek(0)
+            self.listing_error = stderr.read().strip()
+            if self.scheduler.metrics is not None:
+                status = "cancelled" if self.stop_requested else "ok" if self.listing_proc.returncode == 0 else "error"
+                self.scheduler.metrics.record("listing", self.playlist_url, wall=time.monotonic() - started, size=size, status=status)
+
+    def run(self):
+        try:
+            self.log(f"Получение ссылок на видео: {self.playlist_url}. Обработка в папку {self.save_path} начнётся по мере получения ссылок...")
+            self.sweep_temp_dirs()
+            seen = set()
+
+            # Видео уходят в общий планировщик сразу по мере перечисления: первые задачи стартуют, пока список ещё получается
+            for video_url in self.iter_video_urls():
+                if video_url in seen:
+                    continue
+                seen.add(video_url)
+                finished_output = self.journal.unchanged_output(video_id(video_url), self.output_settings)
+                if not finished_output:
+                    # Файл пропал, изменился или нужен с другими настройками — этапы прошлого раза не пропускаем
+                    self.journal.forget_finished(video_id(video_url))
+                size_estimate = None if finished_output else self.estimate_size(video_url)
+                with self.lock:
+                    if self.stop_requested:
+                        break
+                    self.total_videos += 1
+                    index = self.total_videos
+                    if index == 1 or index % 25 == 0:
+                        self.on_progress(self.playlist_url, self.completed_count, self.total_videos, False)
+                    if finished_output:
+                        # Без задачи и без строки в логе на каждое видео: ежедневная проверка плейлиста — это один запрос списка
+                        self.unchanged_count += 1
+                        self.processed_videos.add(index)
+                        self.completed_count += 1
+                    else:
+                        processor = VideoProcessor(video_url, index, 0, self.save_path, self.volume_ratio, self.keep_original_audio, self.video_quality,
+                                                   self.use_powershell, self.scheduler, self.playlist_url, log=self.log, on_finished=self.on_video_processed,
+                                                   media_cache=self.media_cache, journal=self.journal, variants=self.variants,
+                                                   scratch_dir=self.scratch_path, size_estimate=size_estimate)
+                        self.workers[index] = processor
+                if not finished_output:
+                    processor.start()
+
+            if self.stop_requested:
+                return
+
+            if self.total_videos == 0:
+                self.log(f"Ошибка получения ссылок для {self.playlist_url}: {self.listing_error}")
+                self.on_finished(self.playlist_url)
+                return
+            if self.listing_proc.returncode != 0:
+                self.log(f"Список видео для {self.playlist_url} получен не полностью: {self.listing_error}")
+
+            with self.lock:
+                self.listing_done = True
+                for processor in self.workers.values():
+                    processor.total = self.total_videos
+                self.log(f"Найдено {self.total_videos} видео для {self.playlist_url}, "
+                         f"новых или изменившихся: {self.total_videos - self.unchanged_count}, без изменений: {self.unchanged_count}")
+                self.on_progress(self.playlist_url, len(self.processed_videos), self.total_videos, True)
+                if self.completed_count == self.total_videos:
+                    self.report_failures()
+                    self.all_done.set()
+
+            # Ждём без опроса: событие выставляет последний завершившийся ролик или остановка
+            self.all_done.wait()
+
+        except Exception as e:
+            self.log(f"Критическая ошибка: {str(e)}")
+            self.on_finished(self.playlist_url)
+        finally:
+            self.write_report()
+            if not self.stop_requested:
+                self.check_completion()
+
+    def sweep_temp_dirs(self):
+        """Удаляем temp_* упавших запусков; папки, которые журнал держит для продолжения, не трогаем."""
+        keep = self.journal.temp_dirs()
+        for folder in {self.save_path, self.scratch_path}:
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                if name.startswith("temp_") and os.path.isdir(path) and os.path.normcase(os.path.abspath(path)) not in keep:
+                    self.log(f"Удаляем временную папку прошлого запуска: {path}")
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def estimate_size(self, video_url):
+        """Функция оценки размера видео для планировщика: её вызывают при допуске видео, а не при постановке в очередь.
+
+        Без оценки видео допускается без учёта места на диске.
+        """
+        if self.use_powershell:
+            return None
+        quality_cache = get_quality_cache()
+        vid = video_id(video_url)
+        if not self.size_probed and quality_cache.estimate_size(vid, self.video_quality) is None:
+            # Оценить не по чему: один раз за запуск смотрим форматы первого такого видео — в фоне, чтобы не задерживать очередь
+            self.size_probed = True
+            threading.Thread(target=self.probe_size, args=(quality_cache, video_url), daemon=True).start()
+        return lambda: quality_cache.estimate_size(vid, self.video_quality)
+
+    def probe_size(self, quality_cache, video_url):
+        try:
+            QualityProbe(quality_cache, log=self.log).probe_video(video_id(video_url), video_url)
+        except Exception as e:
+            self.log(f"Не удалось получить форматы {video_url} для оценки размера: {str(e)}")
+
+    def write_report(self):
+        """Отчёт о запуске с перцентилями по этапам — в папку плейлиста."""
+        # Проход, в котором все видео без изменений, ничего не обрабатывал: в режиме наблюдения такие отчёты копились бы на каждом опросе
+        if self.scheduler.metrics is None or self.total_videos == self.unchanged_count:
+            return
+        with self.lock:
+            extra = {
+                "playlist_url": self.playlist_url,
+                "started": self.started_at,
+                "finished": time.time(),
+                "wall_seconds": round(time.time() - self.started_at, 3),
+                "videos": {"total": self.total_videos, "completed": self.completed_count, "unchanged": self.unchanged_count,
+                           "failed": len(self.failed_videos)},
+                "stopped": self.stop_requested,
+            }
+        try:
+            path = self.scheduler.metrics.write_summary(self.playlist_url, self.save_path, extra)
+            self.log(f"Отчёт о запуске: {path}")
+        except OSError as e:
+            self.log(f"Не удалось записать отчёт о запуске: {str(e)}")
+
+    def on_video_processed(self, video_url, index, failed=False):
+        # Вызывается из потока пула планировщика
+        with self.lock:
+            self.workers.pop(index, None)
+            if failed:
+                self.failed_videos[index] = video_url
+            total = self.total_videos if self.listing_done else "?"
+            if index not in self.processed_videos:
+                self.processed_videos.add(index)
+                processed_count = len(self.processed_videos)
+                self.on_progress(self.playlist_url, processed_count, self.total_videos, self.listing_done)
+
+            self.completed_count += 1
+            self.log(f"Completed {self.completed_count}/{total} videos for {self.playlist_url}")
+
+            if self.listing_done and self.completed_count == self.total_videos:
+                self.log(f"All videos processed for {self.playlist_url}!")
+                self.report_failures()
+                self.all_done.set()
+
+    def report_failures(self):
+        # Вызывается под self.lock: ни одно видео не должно пропасть молча
+        if not self.failed_videos:
+            return
+        self.log(f"Не удалось обработать {len(self.failed_videos)} из {self.total_videos} видео для {self.playlist_url}:")
+        for index in sorted(self.failed_videos):
+            self.log(f"  {index}: {self.failed_videos[index]}")
+
+    def stop(self):
+        with self.lock:
+            self.stop_requested = True
+            workers = list(self.workers.values())
+            listing_proc = self.listing_proc
+            self.log(f"Stopping processing for {self.playlist_url}...")
+        if listing_proc and listing_proc.poll() is None:
+            listing_proc.kill()
+        # Ещё не начатые видео просто снимаем с очереди, начатые останавливаем
+        self.scheduler.cancel_owner(self.playlist_url)
+        for worker in workers:
+            worker.stop()
+        self.all_done.set()
+
+    def check_completion(self):
+        with self.lock:
+            all_completed = len(self.processed_videos) == self.total_videos and not self.workers
+            if all_completed:
+                self.log(f"All tasks completed for {self.playlist_url}!")
+                self.on_finished(self.playlist_url)
+
+
+class PlaylistWatcher:
+    """Плейлист под наблюдением: каждые interval секунд список получается заново и в работу идут только новые и изменившиеся видео.
+
+    Остальные аргументы — как у PlaylistWorker; снаружи выглядит так же
+    (start, wait, is_running, status, stop), поэтому консольный режим и демон
+    работают с ним как с обычным плейлистом. Следующая проверка начинается
+    после завершения предыдущей, проверки одного плейлиста не накладываются.
+    """
+
+    def __init__(self, interval, *args, log=print, **kwargs):
+        self.interval = interval
+        self.args = args
+        self.kwargs = kwargs
+        self.log = log
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.worker = PlaylistWorker(*args, log=log, **kwargs)
+        self.passes = 1
+        self.next_poll = None
+        self.thread = None
+
+    @property
+    def playlist_url(self):
+        return self.worker.playlist_url
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"watch-{self.worker.extract_folder_name(self.playlist_url)}", daemon=True)
+        self.thread.start()
+
+    def wait(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def status(self):
+        with self.lock:
+            worker, passes, next_poll = self.worker, self.passes, self.next_poll
+        return dict(worker.status(), watch_interval=self.interval, passes=passes, next_poll=next_poll)
+
+    def run(self):
+        while True:
+            self.worker.run()
+            with self.lock:
+                if self.stopped.is_set():
+                    return
+                self.next_poll = time.time() + self.interval
+            self.log(f"Следующая проверка {self.playlist_url} через {self.interval / 60:g} мин")
+            if self.stopped.wait(self.interval):
+                return
+            with self.lock:
+                if self.stopped.is_set():
+                    return
+                # Прошлый проход завершён целиком, его журнал больше никому не нужен
+                self.worker.journal.close()
+                self.worker = PlaylistWorker(*self.args, log=self.log, **self.kwargs)
+                self.passes += 1
+                self.next_poll = None
+
+    def stop(self):
+        with self.lock:
+            self.stopped.set()
+            worker = self.worker
+        worker.stop()
@@ -0,0 +1,369 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from media_cache import default_cache_dir
+from metrics import get_metrics
+from pipeline import resolve_tool
+
+PLAYLIST_TTL = 24 * 3600  # состав плейлиста меняется чаще, чем форматы видео
+VIDEO_TTL = 7 * 24 * 3600
+SAMPLE_SIZE = 3
+PROBE_TIMEOUT = 30
+LISTING_TIMEOUT = 120
+RECENT_SIZES = 100  # по скольким последним видео считается типичный размер для качества
+
+
+def quality_key(quality):
+    """Ключ сортировки «1080p60» -> (1080, 60): по высоте, затем по частоте кадров."""
+    match = re.match(r'(\d+)p(\d+)?', quality)
+    if not match:
+        return (0, 0)
+    return (int(match.group(1)), int(match.group(2) or 0))
+
+
+def sort_qualities(qualities):
+    return ["best"] + sorted(set(qualities) - {"best"}, key=quality_key, reverse=True)
+
+
+def format_quality(fmt):
+    """Качество формата видео: format_note вида 1080p60, иначе высота и fps; None, если не понять."""
+    match = re.search(r'(\d+p(?:\d+)?)', fmt.get("format_note") or "")
+    if match:
+        return match.group(1)
+    if fmt.get("height"):
+        fps = fmt.get("fps") or 0
+        return f"{fmt['height']}p" + (f"{int(fps)}" if fps > 30 else "")
+    return None
+
+
+def qualities_from_info(info):
+    """Качества видео из JSON yt-dlp (-J)."""
+    qualities = set()
+    for fmt in info.get("formats") or []:
+        quality = format_quality(fmt) if fmt.get("vcodec") != "none" else None
+        if quality:
+            qualities.add(quality)
+    return sorted(qualities, key=quality_key, reverse=True)
+
+
+def format_size(fmt, duration):
+    """Размер формата в байтах: точный, приблизительный или по битрейту и длительности; 0, если неизвестен."""
+    if fmt.get("filesize") or fmt.get("filesize_approx"):
+        return fmt.get("filesize") or fmt.get("filesize_approx")
+    if fmt.get("tbr") and duration:
+        # tbr — кбит/с
+        return int(fmt["tbr"] * 125 * duration)
+    return 0
+
+
+def sizes_from_info(info):
+    """Оценка размера скачанного видео (видео и лучшее аудио) для каждого качества из JSON yt-dlp (-J)."""
+    duration = info.get("duration") or 0
+    audio = 0
+    sizes = {}
+    for fmt in info.get("formats") or []:
+        size = format_size(fmt, duration)
+        if fmt.get("vcodec") == "none":
+            audio = max(audio, size)
+            continue
+        quality = format_quality(fmt)
+        if quality:
+            sizes[quality] = max(sizes.get(quality, 0), size)
+    sizes = {quality: size + audio for quality, size in sizes.items() if size}
+    if sizes:
+        sizes["best"] = max(sizes.values())
+    return sizes
+
+
+def size_for_quality(sizes, quality):
+    """Размер для выбранного качества: как format_selector, берём лучшее не выше запрошенной высоты."""
+    if quality in sizes:
+        return sizes[quality]
+    height = quality_key(quality)[0]
+    if not height:
+        return sizes.get("best")
+    fitting = [size for name, size in sizes.items() if name != "best" and quality_key(name)[0] <= height]
+    return max(fitting) if fitting else None
+
+
+class QualityCache:
+    """Кэш на диске: состав плейлистов, доступные качества видео и их размеры по ID, со сроком годности.
+
+    Размеры нужны планировщику для допуска видео по свободному месту: для
+    проверенного видео берётся его собственная оценка, для прочих — типичный
+    размер по последним проверенным и скачанным видео того же качества.
+    """
+
+    def __init__(self, path=None, playlist_ttl=PLAYLIST_TTL, video_ttl=VIDEO_TTL):
+        self.path = path or os.path.join(default_cache_dir(), "qualities.json")
+        self.playlist_ttl = playlist_ttl
+        self.video_ttl = video_ttl
+        self.lock = threading.Lock()
+        self.data = self.load()
+        self.recent_sizes = defaultdict(lambda: deque(maxlen=RECENT_SIZES))  # качество -> байты, только в памяти
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault("playlists", {})
+        data.setdefault("videos", {})
+        return data
+
+    def save(self):
+        # Пишем во временный файл и подменяем: параллельные чтения не увидят половину JSON
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    def fresh(self, entry, ttl):
+        return entry is not None and time.time() - entry.get("ts", 0) < ttl
+
+    def playlist_videos(self, playlist_url):
+        """Список (id, url) видео плейлиста или None, если записи нет или она устарела."""
+        with self.lock:
+            entry = self.data["playlists"].get(playlist_url)
+            if self.fresh(entry, self.playlist_ttl):
+                return [tuple(video) for video in entry["videos"]]
+            return None
+
+    def video_qualities(self, video_id):
+        with self.lock:
+            entry = self.data["videos"].get(video_id)
+            if self.fresh(entry, self.video_ttl):
+                return entry["qualities"]
+            return None
+
+    def playlist_qualities(self, playlist_url):
+        """Качества плейлиста целиком из кэша (по образцам) или None — тогда нужна проверка."""
+        videos = self.playlist_videos(playlist_url)
+        if not videos:
+            return None
+        qualities = []
+        for video_id, _ in videos[:SAMPLE_SIZE]:
+            cached = self.video_qualities(video_id)
+            if cached is None:
+                return None
+            qualities += cached
+        return sort_qualities(qualities)
+
+    def store_playlist(self, playlist_url, videos):
+        with self.lock:
+            self.data["playlists"][playlist_url] = {"ts": time.time(), "videos": [list(video) for video in videos]}
+            self.prune()
+            self.save()
+
+    def store_video(self, video_id, qualities, sizes=None):
+        with self.lock:
+            self.data["videos"][video_id] = {"ts": time.time(), "qualities": qualities, "sizes": sizes or {}}
+            # Оценку нового видео добавляем к уже собранным размерам, не теряя фактических размеров скачанных
+            for quality, recent in self.recent_sizes.items():
+                size = size_for_quality(sizes or {}, quality)
+                if size:
+                    recent.append(size)
+            self.save()
+
+    def note_size(self, quality, size):
+        """Фактический размер скачанного видео; на диск не пишется."""
+        if size:
+            with self.lock:
+                self.typical_sizes(quality).append(size)
+
+    def typical_sizes(self, quality):
+        # Вызывается под self.lock: при первом обращении заполняем по проверенным видео
+        sizes = self.recent_sizes.get(quality)
+        if sizes is None:
+            sizes = self.recent_sizes[quality]
+            for entry in self.data["videos"].values():
+                size = size_for_quality(entry.get("sizes") or {}, quality)
+                if size:
+                    sizes.append(size)
+        return sizes
+
+    def estimate_size(self, video_id, quality):
+        """Ожидаемый размер скачанного видео в байтах или None, если оценить не по чему."""
+        with self.lock:
+            entry = self.data["videos"].get(video_id)
+            size = size_for_quality(entry.get("sizes") or {}, quality) if entry else None
+            if size:
+                return size
+            sizes = sorted(self.typical_sizes(quality))
+            return sizes[len(sizes) // 2] if sizes else None
+
+    def prune(self):
+        # Вызывается под self.lock: выбрасываем устаревшие записи, чтобы файл не рос бесконечно
+        now = time.time()
+        for section, ttl in (("playlists", self.playlist_ttl), ("videos", self.video_ttl)):
+            stale = [key for key, entry in self.data[section].items() if now - entry.get("ts", 0) >= ttl]
+            for key in stale:
+                del self.data[section][key]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_quality_cache():
+    """Общий на процесс кэш качеств."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QualityCache()
+        return _cache
+
+
+class ProbeCancelled(Exception):
+    pass
+
+
+class QualityProbe:
+    """Определение доступных качеств плейлиста: один запрос списка и параллельная проверка образцов.
+
+    Проверку можно отменить из любого потока: запущенные yt-dlp убиваются сразу.
+    Одновременные проверки одного и того же плейлиста не дублируются — второй
+    вызов дожидается результата первого.
+    """
+
+    inflight = {}  # playlist_url -> {"done": bool, "result": list | None}
+    inflight_cond = threading.Condition()
+
+    def __init__(self, cache=None, log=print):
+        self.cache = cache or get_quality_cache()
+        self.log = log
+        self.procs = set()
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            procs = list(self.procs)
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+        with self.inflight_cond:
+            self.inflight_cond.notify_all()
+
+    def run_json(self, args, timeout):
+        with self.lock:
+            if self.cancelled.is_set():
+                raise ProbeCancelled()
+            proc = subprocess.Popen([resolve_tool("yt-dlp")] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                                    text=True, encoding="utf-8", errors="replace")
+            self.procs.add(proc)
+        started = time.monotonic()
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            get_metrics().record("probe", wall=time.monotonic() - started, status="timeout")
+            raise
+        finally:
+            with self.lock:
+                self.procs.discard(proc)
+        status = "cancelled" if self.cancelled.is_set() else "ok" if proc.returncode == 0 else "error"
+        get_metrics().record("probe", wall=time.monotonic() - started, size=len(stdout), status=status)
+        if self.cancelled.is_set():
+            raise ProbeCancelled()
+        if proc.returncode != 0:
+            raise RuntimeError(stderr.strip() or f"yt-dlp exited with code {proc.returncode}")
+        return json.loads(stdout)
+
+    def list_videos(self, playlist_url):
+        """Один вызов --flat-playlist -J вместо построчного списка: сразу и ID, и ссылки."""
+        videos = self.cache.playlist_videos(playlist_url)
+        if videos is not None:
+            return videos
+        info = self.run_json(["--flat-playlist", "-J", playlist_url], LISTING_TIMEOUT)
+        entries = info.get("entries") if info.get("_type") == "playlist" else [info]
+        videos = []
+        for entry in entries or []:
+            if entry and entry.get("id"):
+                videos.append((entry["id"], entry.get("url") or entry.get("webpage_url") or f"https://www.youtube.com/watch?v={entry['id']}"))
+        self.cache.store_playlist(playlist_url, videos)
+        return videos
+
+    def probe_video(self, video_id, video_url):
+        cached = self.cache.video_qualities(video_id)
+        if cached is not None:
+            return cached
+        self.log(f"Checking formats for video {video_id}: {video_url}")
+        info = self.run_json(["-J", "--no-playlist", video_url], PROBE_TIMEOUT)
+        qualities = qualities_from_info(info)
+        self.cache.store_video(video_id, qualities, sizes_from_info(info))
+        return qualities
+
+    def get_available_qualities(self, playlist_url):
+        """Качества плейлиста; при отмене бросает ProbeCancelled."""
+        while True:
+            cached = self.cache.playlist_qualities(playlist_url)
+            if cached is not None:
+                self.log(f"Returning cached qualities for {playlist_url}: {cached}")
+                return cached
+
+            with self.inflight_cond:
+                entry = self.inflight.get(playlist_url)
+                if entry is None:
+                    entry = {"done": False, "result": None}
+                    self.inflight[playlist_url] = entry
+                    break
+                self.log(f"Quality check for {playlist_url} is already running, waiting for it")
+                self.inflight_cond.wait_for(lambda: entry["done"] or self.cancelled.is_set())
+                if self.cancelled.is_set():
+                    raise ProbeCancelled()
+                if entry["result"] is not None:
+                    return entry["result"]
+                # Первую проверку отменили — пробуем сами
+
+        result = None
+        try:
+            result = self.probe(playlist_url)
+            return result
+        finally:
+            with self.inflight_cond:
+                entry["done"] = True
+                entry["result"] = result
+                del self.inflight[playlist_url]
+                self.inflight_cond.notify_all()
+
+    def probe(self, playlist_url):
+        self.log(f"Starting quality check for {playlist_url}")
+        try:
+            samples = self.list_videos(playlist_url)[:SAMPLE_SIZE]
+        except ProbeCancelled:
+            raise
+        except Exception as e:
+            self.log(f"Failed to get video list for {playlist_url}: {str(e)}")
+            return ["best"]
+
+        qualities = []
+        with ThreadPoolExecutor(max_workers=max(1, len(samples))) as executor:
+            futures = {executor.submit(self.probe_video, video_id, video_url): video_id for video_id, video_url in samples}
+            for future, video_id in futures.items():
+                try:
+                    qualities += future.result()
+                except ProbeCancelled:
+                    pass
+                except subprocess.TimeoutExpired:
+                    self.log(f"Timeout expired while getting formats for {video_id}")
+                except Exception as e:
+                    self.log(f"yt-dlp -J failed for {video_id}: {str(e)}")
+        if self.cancelled.is_set():
+            raise ProbeCancelled()
+        qualities = sort_qualities(qualities)
+        if len(qualities) == 1:
+            self.log("No valid video found with available qualities")
+        else:
+            self.log(f"Available qualities: {qualities}")
+        return qualities
@@ -0,0 +1,431 @@
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import get_metrics, result_bytes
+
+# Этапы с отдельными лимитами: сеть (скачивание), запросы к переводчику, CPU (ffmpeg)
+STAGES = ("download", "translate", "mux")
+DEFAULT_LIMITS = {"download": 3, "translate": 2, "mux": 2}
+AIMD_COOLDOWN = 30  # не уменьшаем лимит этапа чаще, чем раз в столько секунд
+DISK_RESERVE = 1024 ** 3  # столько места на диске оставляем свободным сверх оценок видео в работе
+
+
+class StageCancelled(Exception):
+    def __init__(self, message="Processing stopped"):
+        super().__init__(message)
+
+
+class FairQueue:
+    """Очередь с круговым обходом владельцев (плейлистов); синхронизация — снаружи."""
+
+    def __init__(self):
+        self.items = OrderedDict()  # owner -> deque
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, owner, item):
+        self.items.setdefault(owner, deque()).append(item)
+        self.size += 1
+
+    def peek(self):
+        return next(iter(self.items.values()))[0]
+
+    def pop(self):
+        owner, queue = next(iter(self.items.items()))
+        item = queue.popleft()
+        # Владелец уходит в конец круга, если у него ещё есть элементы
+        del self.items[owner]
+        if queue:
+            self.items[owner] = queue
+        self.size -= 1
+        return item
+
+    def remove(self, owner, predicate=None):
+        """Убираем элементы владельца (все или подходящие под predicate) и возвращаем их."""
+        queue = self.items.get(owner)
+        if not queue:
+            return []
+        removed = [item for item in queue if predicate is None or predicate(item)]
+        if len(removed) == len(queue):
+            del self.items[owner]
+        else:
+            self.items[owner] = deque(item for item in queue if not (predicate is None or predicate(item)))
+        self.size -= len(removed)
+        return removed
+
+
+class Job:
+    """Граф этапов одного видео: {имя: (этап планировщика, зависимости, функция)}.
+
+    Функция получает словарь результатов уже выполненных этапов. on_done(job)
+    вызывается ровно один раз, когда ни один этап больше не выполняется.
+    retry(имя, ошибка, номер попытки) возвращает задержку перед повтором
+    упавшего этапа в секундах или None, если повторять не нужно.
+    disk — оценка места [(папка, байты)], которое видео займёт, пока оно в работе,
+    или функция, которая возвращает её в момент допуска видео.
+    """
+
+    def __init__(self, owner, stages, on_done=None, on_failure=None, retry=None):
+        self.owner = owner
+        self.stages = stages
+        self.on_done = on_done
+        self.on_failure = on_failure
+        self.retry = retry
+        self.pending = dict(stages)
+        self.results = {}
+        self.attempts = {}
+        self.timers = {}  # этапы, ждущие повтора
+        self.queued_at = {}  # этап -> когда попал в очередь пула (для замера ожидания)
+        self.running = 0
+        self.error = None
+        self.state = "queued"  # queued -> active -> done
+        self.disk = []
+        self.reserved = {}  # устройство -> байты, учтённые при допуске
+
+
+class StagePool:
+    """Фиксированный пул потоков одного этапа; размер пула и есть лимит этапа.
+
+    Лимит подстраивается по AIMD: при ограничении частоты запросов он делится
+    пополам, а после limit успешных этапов подряд растёт на 1, но не выше
+    max_limit, заданного пользователем.
+    """
+
+    def __init__(self, stage, limit, execute):
+        self.stage = stage
+        self.limit = limit
+        self.max_limit = limit
+        self.successes = 0
+        self.decreased_at = 0.0
+        self.execute = execute
+        self.queue = FairQueue()
+        self.cond = threading.Condition()
+        self.threads = 0
+        self.busy = 0
+
+    def put(self, owner, task):
+        with self.cond:
+            self.queue.push(owner, task)
+            # Поток создаём только если все существующие заняты; дальше он переиспользуется
+            if self.threads < self.limit and self.threads - self.busy < len(self.queue):
+                self.threads += 1
+                threading.Thread(target=self.worker, name=f"{self.stage}-worker-{self.threads}", daemon=True).start()
+            else:
+                self.cond.notify()
+
+    def remove(self, owner, predicate):
+        with self.cond:
+            return self.queue.remove(owner, predicate)
+
+    def set_limit(self, limit):
+        """Потолок от пользователя; текущий лимит сбрасывается на него."""
+        with self.cond:
+            self.max_limit = limit
+            self.successes = 0
+            self.resize(limit)
+
+    def resize(self, limit):
+        # Вызывается под self.cond
+        self.limit = limit
+        while self.threads < self.limit and self.threads - self.busy < len(self.queue):
+            self.threads += 1
+            threading.Thread(target=self.worker, name=f"{self.stage}-worker-{self.threads}", daemon=True).start()
+        self.cond.notify_all()
+
+    def report(self, outcome):
+        """Учитываем итог этапа ("ok" или "rate_limited"); возвращаем новый лимит, если он изменился."""
+        with self.cond:
+            if outcome == "rate_limited":
+                self.successes = 0
+                now = time.monotonic()
+                # Несколько отказов одной «волны» приходят почти одновременно — уменьшаем лимит один раз
+                if self.limit > 1 and now - self.decreased_at >= AIMD_COOLDOWN:
+                    self.decreased_at = now
+                    self.resize(max(1, self.limit // 2))
+                    return self.limit
+            elif outcome == "ok" and self.limit < self.max_limit:
+                self.successes += 1
+                if self.successes >= self.limit:
+                    self.successes = 0
+                    self.resize(self.limit + 1)
+                    return self.limit
+        return None
+
+    def queued(self):
+        with self.cond:
+            return len(self.queue)
+
+    def worker(self):
+        while True:
+            with self.cond:
+                while not self.queue and self.threads <= self.limit:
+                    self.cond.wait()
+                if self.threads > self.limit:
+                    # Лимит уменьшили — лишний поток завершается
+                    self.threads -= 1
+                    return
+                task = self.queue.pop()
+                self.busy += 1
+            try:
+                self.execute(task)
+            finally:
+                with self.cond:
+                    self.busy -= 1
+
+
+class StageScheduler:
+    """Общий на процесс планировщик: очередь видео по плейлистам и пул потоков на каждый этап.
+
+    Видео допускаются в работу по кругу между плейлистами, пока активных видео
+    меньше capacity() и на дисках хватает места под их оценку (Job.disk) сверх
+    уже допущенных. Завершение этапа сразу ставит в очередь следующие этапы,
+    а завершение видео — сразу допускает следующее, без опроса по таймеру.
+    """
+
+    def __init__(self, limits=None, log=None, metrics=None):
+        limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.log = log or (lambda message: None)
+        # Замеры этапов (metrics.Metrics); без них планировщик ничего не измеряет
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.jobs = FairQueue()
+        self.active_jobs = 0
+        self.pools = {stage: StagePool(stage, limits[stage], self.execute) for stage in STAGES}
+        self.disk_reserve = DISK_RESERVE
+        self.reserved = {}  # устройство -> байты, занятые по оценкам допущенных видео
+        self.waiting_for_disk = False
+
+    def limits(self):
+        """Текущие (подстроенные) лимиты этапов."""
+        return {stage: pool.limit for stage, pool in self.pools.items()}
+
+    def max_limits(self):
+        """Потолки лимитов, заданные пользователем."""
+        return {stage: pool.max_limit for stage, pool in self.pools.items()}
+
+    def set_limits(self, limits):
+        for stage, limit in limits.items():
+            self.pools[stage].set_limit(max(1, int(limit)))
+        with self.lock:
+            self.admit()
+
+    def set_disk_reserve(self, size):
+        with self.lock:
+            self.disk_reserve = max(0, int(size))
+            self.admit()
+
+    def reserved_bytes(self):
+        with self.lock:
+            return sum(self.reserved.values())
+
+    def capacity(self):
+        """Сколько видео может быть в работе одновременно по всем лимитам."""
+        return sum(self.limits().values())
+
+    def queued(self):
+        with self.lock:
+            return len(self.jobs)
+
+    def submit(self, job):
+        with self.lock:
+            self.jobs.push(job.owner, job)
+            self.admit()
+
+    def cancel(self, job):
+        """Отменяем видео: убираем его из очередей; выполняющиеся этапы останавливает владелец задачи."""
+        finished = None
+        with self.lock:
+            if job.state == "done":
+                return
+            if job.error is None:
+                job.error = StageCancelled()
+            job.pending.clear()
+            if job.state == "queued":
+                self.jobs.remove(job.owner, lambda queued: queued is job)
+                job.state = "done"
+                finished = job
+            else:
+                for pool in self.pools.values():
+                    job.running -= len(pool.remove(job.owner, lambda task: task[0] is job))
+                for timer in job.timers.values():
+                    timer.cancel()
+                job.running -= len(job.timers)
+                job.timers.clear()
+                finished = self.finish_if_idle(job)
+        if finished:
+            self.notify_done(finished)
+
+    def cancel_owner(self, owner):
+        """Отменяем все ещё не начатые видео владельца и возвращаем их."""
+        with self.lock:
+            jobs = self.jobs.remove(owner)
+            for job in jobs:
+                job.error = StageCancelled()
+                job.state = "done"
+        for job in jobs:
+            self.notify_done(job)
+        return jobs
+
+    def admit(self):
+        # Вызывается под self.lock
+        while self.jobs and self.active_jobs < self.capacity():
+            if not self.reserve_disk(self.jobs.peek()):
+                break
+            job = self.jobs.pop()
+            job.state = "active"
+            self.active_jobs += 1
+            self.dispatch(job)
+
+    def reserve_disk(self, job):
+        # Вызывается под self.lock: учитываем место под видео или отказываем, пока его не хватает
+        need = {}
+        paths = {}
+        # Оценка может появиться уже после постановки в очередь, поэтому функцию вызываем только при допуске
+        disk = job.disk() if callable(job.disk) else job.disk
+        for path, size in disk:
+            device = disk_device(path)
+            need[device] = need.get(device, 0) + size
+            paths[device] = path
+        for device, size in need.items():
+            # Если на диске ничего не занято нашими видео, пускаем в любом случае — иначе очередь не сдвинется никогда
+            if not self.reserved.get(device):
+                continue
+            free = shutil.disk_usage(paths[device]).free - self.reserved[device] - self.disk_reserve
+            if free < size:
+                if not self.waiting_for_disk:
+                    self.waiting_for_disk = True
+                    self.log(f"Waiting for disk space in {paths[device]}: need about {size // 1024 ** 2} MiB, "
+                             f"{max(0, free) // 1024 ** 2} MiB available beyond videos in progress")
+                return False
+        self.waiting_for_disk = False
+        for device, size in need.items():
+            self.reserved[device] = self.reserved.get(device, 0) + size
+        job.reserved = need
+        return True
+
+    def release_disk(self, job):
+        # Вызывается под self.lock
+        for device, size in job.reserved.items():
+            self.reserved[device] -= size
+            if self.reserved[device] <= 0:
+                del self.reserved[device]
+        job.reserved = {}
+
+    def dispatch(self, job):
+        # Вызывается под self.lock: ставим в очереди пулов все этапы, у которых готовы зависимости
+        ready = [name for name, (_, deps, _) in job.pending.items() if all(dep in job.results for dep in deps)]
+        for name in ready:
+            stage, _, func = job.pending.pop(name)
+            job.running += 1
+            job.queued_at[name] = time.monotonic()
+            self.pools[stage].put(job.owner, (job, name, func))
+
+    def execute(self, task):
+        job, name, func = task
+        started = time.monotonic()
+        try:
+            value = func(job.results)
+        except Exception as e:
+            value, error = None, e
+        else:
+            error = None
+        if self.metrics is not None:
+            if error is None:
+                status = "ok"
+            elif isinstance(error, StageCancelled):
+                status = "cancelled"
+            else:
+                status = getattr(error, "kind", "error")
+            self.metrics.record(name, job.owner, wall=time.monotonic() - started, wait=started - job.queued_at.pop(name, started),
+                                size=result_bytes(value), status=status, retry=job.attempts.get(name, 0) > 0)
+
+        outcome = "ok" if error is None else getattr(error, "kind", None)
+        if outcome in ("ok", "rate_limited"):
+            stage = job.stages[name][0]
+            limit = self.pools[stage].report(outcome)
+            if limit is not None:
+                reason = "rate limited, backing off" if outcome == "rate_limited" else "healthy, ramping up"
+                self.log(f"Stage {stage}: {reason}, concurrency is now {limit}/{self.pools[stage].max_limit}")
+                if outcome == "ok":
+                    with self.lock:
+                        self.admit()
+
+        delay = None
+        if error is not None and job.retry is not None and job.error is None and not isinstance(error, StageCancelled):
+            attempt = job.attempts.get(name, 0) + 1
+            delay = job.retry(name, error, attempt)
+
+        on_failure = None
+        with self.lock:
+            if delay is not None and job.error is None:
+                # Этап считается выполняющимся, пока ждёт повтора: поток пула при этом свободен
+                job.attempts[name] = attempt
+                timer = threading.Timer(delay, self.requeue, args=(task,))
+                timer.daemon = True
+                job.timers[name] = timer
+                timer.start()
+                return
+            job.running -= 1
+            if error is None:
+                job.results[name] = value
+            elif job.error is None:
+                job.error = error
+                job.pending.clear()
+                on_failure = job.on_failure
+            if job.error is None:
+                self.dispatch(job)
+            finished = self.finish_if_idle(job)
+        if on_failure:
+            # Например, останавливаем параллельный этап того же видео
+            on_failure()
+        if finished:
+            self.notify_done(finished)
+
+    def requeue(self, task):
+        job, name, func = task
+        with self.lock:
+            if job.timers.pop(name, None) is None:
+                # Повтор отменён вместе с задачей
+                return
+            job.queued_at[name] = time.monotonic()
+            self.pools[job.stages[name][0]].put(job.owner, task)
+
+    def finish_if_idle(self, job):
+        # Вызывается под self.lock
+        if job.state != "active" or job.running or job.pending:
+            return None
+        job.state = "done"
+        self.active_jobs -= 1
+        self.release_disk(job)
+        self.admit()
+        return job
+
+    def notify_done(self, job):
+        if job.on_done:
+            job.on_done(job)
+
+
+def disk_device(path):
+    """Устройство (st_dev) папки; папки, которой ещё нет, — по ближайшему существующему родителю."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Единственный экземпляр планировщика на процесс."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = StageScheduler(metrics=get_metrics())
+        return _scheduler